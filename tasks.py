@@ -1,13 +1,45 @@
+import glob
+from contextlib import contextmanager
 from invoke import task
 import tqa_utils.render_html as render_html
 # from tqa_utils.validate_and_split import DataSetIntegrityChecker
 # from tqa_utils.validate_and_split import TestTrainSplitter
 from tqa_utils.evaluate import Evaluator
+from tqa_utils.answer_key import build_answer_key
+from tqa_utils.common_utils import LessonStore
+from tqa_utils.bootstrap import BootstrapResampler
+from tqa_utils.chance import ChanceDistribution
+from tqa_utils.session import EvaluationSession
+from tqa_utils.compare import SubmissionComparer
+from tqa_utils.batch import BatchEvaluator
+from tqa_utils import server as evaluation_server
+from tqa_utils.synthetic import SyntheticDatasetGenerator, write_submission
+from tqa_utils.profiling import profiling
+
+
+@contextmanager
+def task_profile(profile):
+    with profiling(profile) as active_profiler:
+        yield
+    if active_profiler:
+        active_profiler.report().print_report()
 
 
 @task
-def make_html(context, data_path='tqa_dataset.json'):
-    render_html.render_html_from_dataset(data_path)
+def make_html(context, data_path='tqa_dataset.json', streaming=False, workers=1, incremental=False, profile=False):
+    with task_profile(profile):
+        render_html.render_html_from_dataset(data_path, streaming=streaming, workers=int(workers), incremental=incremental)
+
+
+@task
+def make_sample_pages(context, data_path='tqa_dataset.json', qid_path='missing_qids.txt', out_path='./sample_questions',
+                      store_path='', profile=False):
+    with open(qid_path, 'r') as f:
+        qids = [line.strip() for line in f if line.strip()]
+    with task_profile(profile):
+        not_found = render_html.render_sample_questions(data_path, qids, out_path, store_path or None)
+    if not_found:
+        print('{} question ids were not found in the dataset'.format(len(not_found)))
 
 
 @task
@@ -15,7 +47,74 @@ def test_train_split(context):
     pass
 
 @task 
-def compute_accuracies(context, data_path='tqa_dataset.json', answer_path=''):
-    model_evaluator = Evaluator(data_path)
-    accuracies = model_evaluator.evaluate_model(answer_path)
+def compute_accuracies(context, data_path='tqa_dataset.json', answer_path='', answer_key_path='', fail_fast=False,
+                       bootstrap=0, bootstrap_by_lesson=False, seed=None, breakdowns='', chance_distribution=False,
+                       profile=False):
+    seed = int(seed) if seed is not None else None
+    resampler = BootstrapResampler(int(bootstrap), by_lesson=bootstrap_by_lesson, seed=seed) if bootstrap else None
+    breakdowns = [breakdown.split('+') for breakdown in breakdowns.split(',') if breakdown]
+    chance = ChanceDistribution() if chance_distribution else None
+    with task_profile(profile):
+        model_evaluator = Evaluator(data_path, answer_key_file=answer_key_path or None)
+        accuracies = model_evaluator.evaluate_model(answer_path, fail_fast=fail_fast, bootstrap=resampler,
+                                                    breakdowns=breakdowns, chance=chance)
     return accuracies
+
+
+@task
+def compile_answer_key(context, data_path='tqa_dataset.json', answer_key_path='tqa_answer_key.bin', profile=False):
+    with task_profile(profile):
+        build_answer_key(data_path, answer_key_path)
+
+
+@task
+def build_lesson_store(context, data_path='tqa_dataset.json', store_path=''):
+    LessonStore.build(data_path, store_path or data_path + '.lessons')
+
+
+@task
+def compare_submissions(context, data_path='tqa_dataset.json', answer_paths='', answer_key_path='', resamples=1000,
+                        correction='holm', seed=None, profile=False):
+    seed = int(seed) if seed is not None else None
+    with task_profile(profile):
+        session = EvaluationSession(data_path, answer_key_file=answer_key_path or None)
+        comparer = SubmissionComparer(session, int(resamples), correction, seed)
+        comparisons = comparer.compare(answer_paths.split(','))
+    comparer.print_comparison(comparisons)
+    return comparisons
+
+
+@task
+def batch_evaluate(context, data_path='tqa_dataset.json', answer_glob='', out_path='batch_results.csv', answer_key_path='',
+                   workers=0, profile=False):
+    with task_profile(profile):
+        batch_evaluator = BatchEvaluator(data_path, answer_key_path or None, int(workers) or None)
+        try:
+            n_scored = batch_evaluator.evaluate(sorted(glob.glob(answer_glob)), out_path)
+        finally:
+            batch_evaluator.close()
+    return n_scored
+
+
+@task
+def serve_evaluator(context, data_path='tqa_dataset.json', answer_key_path='', host='127.0.0.1', port=8765, max_concurrent=4):
+    evaluation_server.serve(data_path, answer_key_path or None, host, int(port), int(max_concurrent))
+
+
+@task
+def make_synthetic_dataset(context, data_path='synthetic_dataset.json', scale='1', seed=0, answer_path=''):
+    SyntheticDatasetGenerator(float(scale), int(seed)).write_dataset(data_path)
+    if answer_path:
+        write_submission(data_path, answer_path, seed=int(seed))
+
+
+@task
+def benchmark(context, scales='1,10,100', work_dir='benchmark_data', out_path='benchmark_results.json', base_lessons=0,
+              names=''):
+    # imported here so other tasks do not load scikit-learn through validate_and_split
+    from tqa_utils.benchmark import BenchmarkSuite
+    suite = BenchmarkSuite(work_dir, [float(scale) for scale in scales.split(',')], int(base_lessons) or None,
+                           names=[name for name in names.split(',') if name])
+    report = suite.write(suite.run(), out_path)
+    for result in report['results']:
+        print('{benchmark} x{scale}: {wall_seconds:.2f}s, {peak_rss_mb:.0f} MB, {throughput:.0f} {throughput_unit}'.format(**result))
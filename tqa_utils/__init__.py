@@ -1,3 +1,5 @@
 from .evaluate import Evaluator
 from .predictors import Guesser
 from .predictors import Cheater
+from .predictors import RetrievalModel
+from .session import EvaluationSession
@@ -0,0 +1,205 @@
+import re
+import hashlib
+import json
+import struct
+import numpy as np
+from .profiling import profiler
+from .common_utils import DataSetCommonTools
+
+KEY_MAGIC = b'TQAKEY\x00\x01'
+KEY_FORMAT_VERSION = 3
+QUESTION_TYPES = ['diagramQuestions', 'nonDiagramQuestions']
+QID_PREFIXES = {'DQ': 0, 'NDQ': 1}
+NO_ANSWER = 0
+BAD_PREDICTION = 255
+QID_PATTERN = re.compile(r'(DQ|NDQ)_([0-9]{6})')
+
+
+def dataset_content_hash(data_file, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(data_file, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def qid_to_key(qid):
+    match = QID_PATTERN.fullmatch(qid) if isinstance(qid, str) else None
+    if match is None:
+        return -1
+    return (QID_PREFIXES[match.group(1)] << 32) | int(match.group(2))
+
+
+def key_to_qid(qkey):
+    prefixes = {v: k for k, v in QID_PREFIXES.items()}
+    return '{}_{:06d}'.format(prefixes[int(qkey) >> 32], int(qkey) & 0xffffffff)
+
+
+def encode_letter(answer, invalid=BAD_PREDICTION):
+    if isinstance(answer, str) and len(answer) == 1 and 0 < ord(answer) < 128:
+        return ord(answer)
+    return invalid
+
+
+class AnswerKey(object):
+    """
+    fixed-width columnar answer key, sorted by integer qid
+    """
+    columns = [
+        ('qkey', '<i8'),
+        ('qtype', 'u1'),
+        ('subtype', 'u1'),
+        ('n_choices', 'u1'),
+        ('answer', 'u1'),
+        ('lesson', '<i4'),
+        ('meta_lesson', '<i4'),
+    ]
+    dimensions = {
+        'type': ('qtype', 'question_types'),
+        'subtype': ('subtype', 'subtypes'),
+        'lesson': ('lesson', 'lessons'),
+        'metaLesson': ('meta_lesson', 'meta_lessons'),
+        'n_choices': ('n_choices', None)
+    }
+
+    def __init__(self, arrays, categories, dataset_hash=None):
+        self.arrays = arrays
+        self.categories = categories
+        self.subtypes = list(categories['subtypes'])
+        self.lessons = list(categories.get('lessons', []))
+        self.meta_lessons = list(categories.get('meta_lessons', []))
+        self.question_types = list(QUESTION_TYPES)
+        self.dataset_hash = dataset_hash
+        for name, array in arrays.items():
+            setattr(self, name, array)
+
+    def __len__(self):
+        return len(self.qkey)
+
+    @classmethod
+    def from_questions(cls, questions_by_type, dataset_hash=None, question_lessons=None, lesson_meta_ids=None):
+        records = []
+        subtypes = ['']
+        question_lessons = question_lessons or {}
+        lesson_meta_ids = lesson_meta_ids or {}
+        lessons = sorted(set(question_lessons.values()))
+        lesson_codes = {lesson_id: idx for idx, lesson_id in enumerate(lessons)}
+        meta_lessons = sorted(set(lesson_meta_ids.values()))
+        meta_codes = {meta_id: idx for idx, meta_id in enumerate(meta_lessons)}
+        for questions in questions_by_type.values():
+            for qid, question in questions.items():
+                subtype = question.get('questionSubType') or ''
+                if subtype not in subtypes:
+                    subtypes.append(subtype)
+                correct = question.get('correctAnswer', {}).get('processedText')
+                qkey = qid_to_key(qid)
+                records.append((qkey, qkey >> 32, subtypes.index(subtype),
+                                len(question.get('answerChoices') or {}), encode_letter(correct, NO_ANSWER),
+                                lesson_codes.get(question_lessons.get(qid), -1),
+                                meta_codes.get(lesson_meta_ids.get(question_lessons.get(qid)), -1)))
+        records.sort()
+        arrays = {}
+        for idx, (name, dtype) in enumerate(cls.columns):
+            arrays[name] = np.array([record[idx] for record in records], dtype=dtype)
+        categories = {'subtypes': subtypes, 'lessons': lessons, 'meta_lessons': meta_lessons}
+        return cls(arrays, categories, dataset_hash)
+
+    @classmethod
+    @profiler.profiled()
+    def from_dataset(cls, data_file, tools=None, content_hash=True):
+        tools = tools or DataSetCommonTools(data_file)
+        questions_by_type = {q_type: {} for q_type in QUESTION_TYPES}
+        question_lessons = {}
+        lesson_meta_ids = {}
+        for lesson in tools.lessons(streaming=True):
+            lesson_meta_ids[lesson['globalID']] = lesson.get('metaLessonID') or ''
+            for q_type, questions in tools.lesson_question_lookup(lesson).items():
+                questions_by_type[q_type].update(questions)
+                question_lessons.update(dict.fromkeys(questions, lesson['globalID']))
+        dataset_hash = dataset_content_hash(data_file) if content_hash else None
+        return cls.from_questions(questions_by_type, dataset_hash, question_lessons, lesson_meta_ids)
+
+    def save(self, key_file):
+        layout = []
+        offset = 0
+        for name, dtype in self.columns:
+            layout.append([name, dtype, offset])
+            offset += self.arrays[name].nbytes
+            offset += -offset % 8
+        header = json.dumps({
+            'version': KEY_FORMAT_VERSION,
+            'dataset_sha256': self.dataset_hash,
+            'n_questions': len(self),
+            'question_types': self.question_types,
+            'categories': self.categories,
+            'columns': layout
+        }).encode('utf-8')
+        data_start = len(KEY_MAGIC) + 4 + len(header)
+        data_start += -data_start % 64
+        with open(key_file, 'wb') as f:
+            f.write(KEY_MAGIC)
+            f.write(struct.pack('<I', data_start))
+            f.write(header)
+            for name, dtype, col_offset in layout:
+                f.seek(data_start + col_offset)
+                f.write(np.ascontiguousarray(self.arrays[name], dtype=dtype).tobytes())
+            f.truncate(data_start + offset)
+
+    @classmethod
+    def load(cls, key_file, mmap=True):
+        with open(key_file, 'rb') as f:
+            if f.read(len(KEY_MAGIC)) != KEY_MAGIC:
+                raise ValueError('{} is not a compiled answer key'.format(key_file))
+            data_start = struct.unpack('<I', f.read(4))[0]
+            header = json.loads(f.read(data_start - len(KEY_MAGIC) - 4).rstrip(b'\x00').decode('utf-8'))
+        if header['version'] != KEY_FORMAT_VERSION:
+            raise ValueError('answer key format {} is not supported, rebuild {}'.format(header['version'], key_file))
+        if mmap:
+            buf = np.memmap(key_file, dtype=np.uint8, mode='r')
+        else:
+            buf = np.fromfile(key_file, dtype=np.uint8)
+        n_questions = header['n_questions']
+        arrays = {}
+        for name, dtype, col_offset in header['columns']:
+            start = data_start + col_offset
+            arrays[name] = buf[start:start + n_questions * np.dtype(dtype).itemsize].view(dtype)
+        return cls(arrays, header['categories'], header['dataset_sha256'])
+
+    def check_dataset(self, data_file):
+        if self.dataset_hash != dataset_content_hash(data_file):
+            raise ValueError('answer key was not built from {}'.format(data_file))
+
+    def qids(self, rows=None):
+        qkeys = self.qkey if rows is None else self.qkey[rows]
+        return [key_to_qid(qkey) for qkey in qkeys]
+
+    def lookup(self, qids):
+        qkeys = np.fromiter((qid_to_key(qid) for qid in qids), dtype=np.int64)
+        rows = np.searchsorted(self.qkey, qkeys)
+        rows[rows == len(self)] = 0
+        found = (self.qkey[rows] == qkeys) if len(self) else np.zeros(len(qkeys), dtype=bool)
+        return np.where(found, rows, -1)
+
+    def encode_answers(self, answers):
+        return np.fromiter((encode_letter(answer) for answer in answers), dtype=np.uint8)
+
+    def dimension(self, name):
+        if name not in self.dimensions:
+            raise ValueError('unknown breakdown dimension {}, expected one of {}'.format(
+                name, ', '.join(sorted(self.dimensions))))
+        column, labels = self.dimensions[name]
+        codes = self.arrays[column].astype(np.int64)
+        if labels is None:
+            values = np.unique(codes)
+            return np.searchsorted(values, codes), ['{} choices'.format(value) for value in values]
+        return codes, [label or 'none' for label in getattr(self, labels)]
+
+    def chance_scores(self):
+        n_choices = self.n_choices.astype(np.float64)
+        return np.divide(1.0, n_choices, out=np.zeros_like(n_choices), where=n_choices > 0)
+
+
+def build_answer_key(data_file, key_file):
+    answer_key = AnswerKey.from_dataset(data_file)
+    answer_key.save(key_file)
+    return answer_key
@@ -0,0 +1,95 @@
+import os
+import csv
+import json
+import tempfile
+import multiprocessing
+from .answer_key import build_answer_key
+from .session import EvaluationSession
+
+_worker_session = None
+
+
+def _init_worker(data_file, answer_key_file):
+    global _worker_session
+    _worker_session = EvaluationSession(data_file, answer_key_file)
+
+
+def _score_submission(submission_path):
+    return submission_row(_worker_session, submission_path)
+
+
+def submission_row(session, submission_path):
+    row = {'submission': submission_path}
+    try:
+        scored = session.score(submission_path)
+    except (IOError, ValueError) as e:
+        row['error'] = str(e)
+        return row
+    row['n_missing'] = scored.n_missing
+    row['n_errors'] = len(scored.errors)
+    for grouping, results in sorted(scored.results.items()):
+        for cell, n_expected in results['number of questions expected'].items():
+            n_correct = results['total correct'].get(cell, 0)
+            row['{}:{}:correct'.format(grouping, cell)] = n_correct
+            row['{}:{}:accuracy'.format(grouping, cell)] = n_correct / n_expected if n_expected else 0.0
+    return row
+
+
+class BatchEvaluator(object):
+    """
+    scores many submissions over a process pool
+
+    workers memory-map one compiled answer key, so the key is parsed once and
+    shared through the page cache instead of being copied into every process
+    """
+    def __init__(self, data_file, answer_key_file=None, n_workers=None, chunksize=8):
+        self.data_file = data_file
+        self.n_workers = n_workers or multiprocessing.cpu_count()
+        self.chunksize = chunksize
+        self.temp_key_file = None
+        if answer_key_file is None:
+            handle, answer_key_file = tempfile.mkstemp(suffix='.tqakey')
+            os.close(handle)
+            build_answer_key(data_file, answer_key_file)
+            self.temp_key_file = answer_key_file
+        self.answer_key_file = answer_key_file
+        self.session = EvaluationSession(data_file, answer_key_file)
+
+    def fieldnames(self):
+        fields = ['submission', 'n_missing', 'n_errors', 'error']
+        for grouping, engine in sorted(self.session.engines.items()):
+            for cell in engine.group_names + ['overall']:
+                fields += ['{}:{}:correct'.format(grouping, cell), '{}:{}:accuracy'.format(grouping, cell)]
+        return fields
+
+    def iter_rows(self, submission_paths):
+        if self.n_workers == 1:
+            for submission_path in submission_paths:
+                yield submission_row(self.session, submission_path)
+            return
+        pool = multiprocessing.Pool(self.n_workers, _init_worker, (self.data_file, self.answer_key_file))
+        try:
+            for row in pool.imap(_score_submission, submission_paths, self.chunksize):
+                yield row
+        finally:
+            pool.close()
+            pool.join()
+
+    def evaluate(self, submission_paths, out_file):
+        n_rows = 0
+        with open(out_file, 'w') as f:
+            if out_file.endswith('.csv'):
+                writer = csv.DictWriter(f, self.fieldnames(), restval='')
+                writer.writeheader()
+                write_row = writer.writerow
+            else:
+                write_row = lambda row: f.write(json.dumps(row, sort_keys=True) + '\n')
+            for row in self.iter_rows(submission_paths):
+                write_row(row)
+                n_rows += 1
+        return n_rows
+
+    def close(self):
+        if self.temp_key_file and os.path.exists(self.temp_key_file):
+            os.remove(self.temp_key_file)
+        self.temp_key_file = None
@@ -0,0 +1,146 @@
+import os
+import sys
+import json
+import time
+import platform
+import resource
+import warnings
+import multiprocessing
+from .common_utils import stream_lessons
+from .evaluate import Evaluator
+from .answer_key import build_answer_key
+from .validate_and_split import DataSetIntegrityChecker, TestTrainSplitter
+from .render_html import render_html_from_dataset
+from .synthetic import SyntheticDatasetGenerator, write_submission
+
+
+def run_evaluate_model(data_file, submission_file, work_dir):
+    Evaluator(data_file).evaluate_model(submission_file)
+
+
+def run_evaluate_with_answer_key(data_file, submission_file, work_dir):
+    Evaluator(data_file, os.path.join(work_dir, 'answer_key.bin')).evaluate_model(submission_file)
+
+
+def run_compute_split_stats(data_file, submission_file, work_dir):
+    splitter = TestTrainSplitter(work_dir, data_file)
+    test_train_assignments, _ = splitter.perform_split()
+    splitter.compute_split_stats(test_train_assignments)
+
+
+def run_validate_dataset(data_file, submission_file, work_dir):
+    DataSetIntegrityChecker(work_dir, data_file).validate_dataset()
+
+
+def run_render_html(data_file, submission_file, work_dir):
+    render_html_from_dataset(data_file)
+
+
+# name, entry point, unit the throughput is counted in
+benchmarks = [
+    ('evaluate_model', run_evaluate_model, 'questions'),
+    ('evaluate_model_answer_key', run_evaluate_with_answer_key, 'questions'),
+    ('compute_split_stats', run_compute_split_stats, 'lessons'),
+    ('validate_dataset', run_validate_dataset, 'lessons'),
+    ('render_html_from_dataset', run_render_html, 'lessons')
+]
+
+
+def _run_in_child(entry_point, data_file, submission_file, work_dir, connection):
+    os.chdir(work_dir)
+    sys.stdout = open(os.devnull, 'w')
+    warnings.simplefilter('ignore')
+    start = time.time()
+    entry_point(data_file, submission_file, work_dir)
+    wall_time = time.time() - start
+    connection.send((wall_time, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+    connection.close()
+
+
+def dataset_counts(data_file):
+    counts = {'lessons': 0, 'questions': 0}
+    for lesson in stream_lessons(data_file):
+        counts['lessons'] += 1
+        counts['questions'] += sum(len(questions) for questions in lesson['questions'].values())
+    return counts
+
+
+class BenchmarkSuite(object):
+    """
+    times every entry point on synthetic releases, one fresh process per run
+
+    each run happens in a spawned child so its peak rss is its own and not that
+    of the harness or of earlier runs
+    """
+    def __init__(self, work_dir='benchmark_data', scales=(1, 10, 100), base_lessons=None, seed=0, names=None):
+        self.work_dir = os.path.abspath(work_dir)
+        self.scales = scales
+        self.base_lessons = base_lessons
+        self.seed = seed
+        self.benchmarks = [benchmark for benchmark in benchmarks if not names or benchmark[0] in names]
+        self.context = multiprocessing.get_context('spawn')
+
+    def prepare(self, scale):
+        scale_dir = os.path.join(self.work_dir, 'scale_{}'.format(scale))
+        if not os.path.exists(scale_dir):
+            os.makedirs(scale_dir)
+        data_file = os.path.join(scale_dir, 'tqa_dataset.json')
+        submission_file = os.path.join(scale_dir, 'submission.json')
+        key_file = os.path.join(scale_dir, 'answer_key.bin')
+        if not os.path.exists(data_file):
+            generator_args = {'base_lessons': self.base_lessons} if self.base_lessons else {}
+            SyntheticDatasetGenerator(scale, self.seed, **generator_args).write_dataset(data_file)
+            for stale_file in (submission_file, key_file):
+                if os.path.exists(stale_file):
+                    os.remove(stale_file)
+        if not os.path.exists(submission_file):
+            write_submission(data_file, submission_file, seed=self.seed)
+        if not os.path.exists(key_file):
+            # compiled outside the timed run, which measures key-backed evaluation only
+            build_answer_key(data_file, key_file)
+        return scale_dir, data_file, submission_file
+
+    def run_one(self, entry_point, data_file, submission_file, work_dir):
+        receiver, sender = self.context.Pipe(duplex=False)
+        process = self.context.Process(target=_run_in_child, args=(entry_point, data_file, submission_file, work_dir, sender))
+        process.start()
+        sender.close()
+        try:
+            wall_time, max_rss_kb = receiver.recv()
+        except EOFError:
+            raise RuntimeError('{} failed on {}'.format(entry_point.__name__, data_file))
+        finally:
+            process.join()
+        return wall_time, max_rss_kb
+
+    def run(self):
+        results = []
+        for scale in self.scales:
+            scale_dir, data_file, submission_file = self.prepare(scale)
+            counts = dataset_counts(data_file)
+            for name, entry_point, unit in self.benchmarks:
+                wall_time, max_rss_kb = self.run_one(entry_point, data_file, submission_file, scale_dir)
+                results.append({
+                    'benchmark': name,
+                    'scale': scale,
+                    'n_lessons': counts['lessons'],
+                    'n_questions': counts['questions'],
+                    'dataset_bytes': os.path.getsize(data_file),
+                    'wall_seconds': wall_time,
+                    'peak_rss_mb': max_rss_kb / 1024,
+                    'throughput': counts[unit] / wall_time if wall_time else None,
+                    'throughput_unit': '{}/s'.format(unit)
+                })
+        return results
+
+    def write(self, results, out_file):
+        report = {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': multiprocessing.cpu_count(),
+            'results': results
+        }
+        with open(out_file, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        return report
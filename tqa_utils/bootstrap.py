@@ -0,0 +1,69 @@
+from __future__ import division
+import numpy as np
+
+
+class BootstrapResampler(object):
+    """
+    percentile bootstrap intervals for every accuracy cell of a results table
+
+    question level resampling is stratified by cell, so the number correct in a
+    resampled cell is exactly binomial and is drawn directly. lesson level
+    resampling draws multinomial lesson weights and reduces a lesson x cell
+    count matrix with one matrix product per chunk of resamples.
+    """
+    def __init__(self, n_resamples=10000, confidence=0.95, by_lesson=False, seed=None, chunk_size=1000):
+        self.n_resamples = n_resamples
+        self.confidence = confidence
+        self.by_lesson = by_lesson
+        self.chunk_size = chunk_size
+        self.random_state = np.random.RandomState(seed)
+
+    def cell_counts(self, engine, correctness, row_codes=None):
+        in_group = engine.group_codes >= 0
+        n_cells = len(engine.group_names) + 1
+        cell_codes = engine.group_codes[in_group]
+        if row_codes is not None:
+            cell_codes = row_codes[in_group] * n_cells + cell_codes
+        n_rows = 1 if row_codes is None else int(row_codes.max()) + 1
+        correct = np.bincount(cell_codes, weights=correctness[in_group], minlength=n_rows * n_cells)
+        totals = np.bincount(cell_codes, minlength=n_rows * n_cells).astype(np.float64)
+        correct = correct.reshape(n_rows, n_cells)
+        totals = totals.reshape(n_rows, n_cells)
+        correct[:, -1] = correct[:, :-1].sum(axis=1)
+        totals[:, -1] = totals[:, :-1].sum(axis=1)
+        return correct, totals
+
+    def resample_questions(self, engine, correctness):
+        correct, totals = self.cell_counts(engine, correctness)
+        totals = totals[0].astype(np.int64)
+        p_correct = correct[0] / np.maximum(totals, 1)
+        draws = self.random_state.binomial(totals, p_correct, size=(self.n_resamples, len(totals)))
+        return draws / np.maximum(totals, 1)
+
+    def resample_lessons(self, engine, correctness):
+        lesson_codes = engine.answer_key.arrays.get('lesson')
+        if lesson_codes is None or not len(engine.answer_key.lessons) or (lesson_codes < 0).any():
+            raise ValueError('lesson level bootstrap needs an answer key built with lesson ids')
+        correct, totals = self.cell_counts(engine, correctness, lesson_codes.astype(np.int64))
+        has_questions = totals[:, -1] > 0
+        correct, totals = correct[has_questions], totals[has_questions]
+        n_lessons = len(totals)
+        samples = []
+        for start in range(0, self.n_resamples, self.chunk_size):
+            n_chunk = min(self.chunk_size, self.n_resamples - start)
+            weights = self.random_state.multinomial(n_lessons, np.full(n_lessons, 1 / n_lessons), size=n_chunk)
+            samples.append(np.dot(weights, correct) / np.maximum(np.dot(weights, totals), 1))
+        return np.vstack(samples)
+
+    def intervals(self, engine, correctness):
+        if self.by_lesson:
+            samples = self.resample_lessons(engine, correctness)
+        else:
+            samples = self.resample_questions(engine, correctness)
+        tail = (1 - self.confidence) / 2 * 100
+        low, high = np.percentile(samples, [tail, 100 - tail], axis=0)
+        cell_names = engine.group_names + ['overall']
+        return {
+            'accuracy ci low': dict(zip(cell_names, low)),
+            'accuracy ci high': dict(zip(cell_names, high))
+        }
@@ -0,0 +1,66 @@
+from __future__ import division
+import numpy as np
+
+
+def trim_pmf(pmf):
+    support = np.flatnonzero(pmf)
+    return support[0], pmf[support[0]:support[-1] + 1]
+
+
+def poisson_binomial_pmf(probabilities):
+    """
+    pmf of the number of successes of independent trials with the given success probabilities
+
+    questions with the same number of choices share a probability, so the pmf is
+    a convolution of one binomial pmf per distinct probability. the convolutions
+    are direct, so tail probabilities keep their relative precision; binomial
+    entries that underflow to zero are trimmed first to keep them cheap at scale
+    """
+    from scipy import stats
+    probabilities = np.asarray(probabilities, dtype=np.float64)
+    probabilities = probabilities[probabilities > 0]
+    offset, pmf = 0, np.ones(1)
+    for probability in np.unique(probabilities):
+        n_trials = int((probabilities == probability).sum())
+        binomial_offset, binomial = trim_pmf(stats.binom.pmf(np.arange(n_trials + 1), n_trials, probability))
+        offset += binomial_offset
+        pmf = np.convolve(pmf, binomial)
+    full_pmf = np.zeros(len(probabilities) + 1)
+    full_pmf[offset:offset + len(pmf)] = pmf
+    return full_pmf
+
+
+class ChanceDistribution(object):
+    """
+    exact null distribution of every cell's number correct under uniform guessing
+
+    the overall row covers the questions in the engine's groups, the same ones as its
+    accuracy and totals, which can be fewer than the baseline column averages over
+    """
+    def __init__(self, percentiles=(5, 50, 95)):
+        self.percentiles = list(percentiles)
+        self.cell_pmfs = {}
+
+    def pmfs(self, engine):
+        if engine not in self.cell_pmfs:
+            chance_scores = engine.answer_key.chance_scores()
+            in_group = engine.group_codes >= 0
+            pmfs = [poisson_binomial_pmf(chance_scores[engine.group_codes == idx]) for idx in range(len(engine.group_names))]
+            pmfs.append(poisson_binomial_pmf(chance_scores[in_group]))
+            self.cell_pmfs[engine] = pmfs
+        return self.cell_pmfs[engine]
+
+    def columns(self, engine, correct):
+        correct = list(correct) + [sum(correct)]
+        totals = list(engine.totals) + [engine.totals.sum()]
+        columns = {'chance accuracy p{}'.format(percentile): {} for percentile in self.percentiles}
+        columns['p-value vs chance'] = {}
+        for cell, pmf, n_correct, n_total in zip(engine.group_names + ['overall'], self.pmfs(engine), correct, totals):
+            if not n_total:
+                continue
+            cdf = np.cumsum(pmf)
+            for percentile in self.percentiles:
+                n_at_percentile = int(np.searchsorted(cdf, percentile / 100 - 1e-12))
+                columns['chance accuracy p{}'.format(percentile)][cell] = n_at_percentile / n_total
+            columns['p-value vs chance'][cell] = float(min(1.0, pmf[int(n_correct):].sum()))
+        return columns
@@ -1,5 +1,107 @@
 import os
 import json
+from .profiling import profiler
+from .records import Question
+
+
+def stream_lessons(data_file, chunk_size=1 << 16):
+    decoder = json.JSONDecoder()
+    with open(data_file, 'r') as f:
+        buf = f.read(chunk_size)
+        pos = 0
+        started = False
+        eof = not buf
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                pos += 1
+            if pos == len(buf):
+                if eof:
+                    raise ValueError('unexpected end of dataset in {}'.format(data_file))
+                buf = f.read(chunk_size)
+                pos = 0
+                eof = not buf
+                continue
+            if not started:
+                if buf[pos] != '[':
+                    raise ValueError('{} does not hold a list of lessons'.format(data_file))
+                started = True
+                pos += 1
+                continue
+            if buf[pos] == ']':
+                return
+            try:
+                lesson, pos = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if eof:
+                    raise
+                more = f.read(max(chunk_size, len(buf) - pos))
+                buf = buf[pos:] + more
+                pos = 0
+                eof = not more
+                continue
+            yield lesson
+
+
+class LessonStore(object):
+    """
+    random access to single lessons through a jsonl copy of the dataset and a byte offset index
+    """
+    version = 1
+
+    def __init__(self, store_file):
+        self.store_file = store_file
+        with open(store_file + '.index', 'r') as f:
+            self.index = json.load(f)
+        self.lesson_offsets = self.index['lessons']
+        self.question_lessons = self.index['questions']
+
+    @staticmethod
+    def dataset_signature(data_file):
+        data_stat = os.stat(data_file)
+        return {'size': data_stat.st_size, 'mtime': data_stat.st_mtime}
+
+    @classmethod
+    def build(cls, data_file, store_file):
+        lesson_offsets = {}
+        question_lessons = {}
+        with open(store_file, 'wb') as f:
+            for lesson in stream_lessons(data_file):
+                line = (json.dumps(lesson) + '\n').encode('utf-8')
+                lesson_offsets[lesson['globalID']] = [f.tell(), len(line)]
+                for questions in lesson['questions'].values():
+                    for qid in questions:
+                        question_lessons[qid] = lesson['globalID']
+                f.write(line)
+        index = {
+            'version': cls.version,
+            'dataset': cls.dataset_signature(data_file),
+            'lessons': lesson_offsets,
+            'questions': question_lessons
+        }
+        with open(store_file + '.index', 'w') as f:
+            json.dump(index, f)
+        return cls(store_file)
+
+    @classmethod
+    def for_dataset(cls, data_file, store_file=None):
+        store_file = store_file or data_file + '.lessons'
+        if os.path.exists(store_file) and os.path.exists(store_file + '.index'):
+            store = cls(store_file)
+            if store.index['version'] == cls.version and store.index['dataset'] == cls.dataset_signature(data_file):
+                return store
+        return cls.build(data_file, store_file)
+
+    def get_lesson(self, lesson_id):
+        offset, length = self.lesson_offsets[lesson_id]
+        with open(self.store_file, 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.read(length).decode('utf-8'))
+
+    def get_question(self, qid):
+        lesson = self.get_lesson(self.question_lessons[qid])
+        for questions in lesson['questions'].values():
+            if qid in questions:
+                return questions[qid]
 
 
 class DataSetCommonTools(object):
@@ -7,6 +109,7 @@ class DataSetCommonTools(object):
     def __init__(self, data_file):
         self.data_json_file = data_file
         self.dataset = None
+        self.lesson_store = None
 
     def dict_key_extract(self, key, var):
         if hasattr(var, 'items'):
@@ -21,26 +124,68 @@ class DataSetCommonTools(object):
                         for result in self.dict_key_extract(key, d):
                             yield result
 
+    def visit_keys(self, var, visitors):
+        """
+        walks var once, calling visitors[key](value) for every value stored under one of the visited keys
+        """
+        if hasattr(var, 'items'):
+            for k, v in var.items():
+                if k in visitors:
+                    visitors[k](v)
+                if isinstance(v, dict):
+                    self.visit_keys(v, visitors)
+                elif isinstance(v, list):
+                    for d in v:
+                        self.visit_keys(d, visitors)
+
+    def extract_keys(self, keys, var):
+        found = {key: [] for key in keys}
+        self.visit_keys(var, {key: values.append for key, values in found.items()})
+        return found
+
+    @profiler.profiled()
     def load_dataset(self):
         with open(self.data_json_file, 'r') as f:
             self.dataset = json.load(f)
 
-    def build_question_lookup(self, by_type=False):
-        self.load_dataset()
-        non_diagram_questions = [list(self.dict_key_extract('nonDiagramQuestions', lesson)) for lesson in self.dataset]
-        diagram_questions = [list(self.dict_key_extract('diagramQuestions', lesson)) for lesson in self.dataset]
+    def open_lesson_store(self, store_file=None):
+        if self.lesson_store is None:
+            self.lesson_store = LessonStore.for_dataset(self.data_json_file, store_file)
+        return self.lesson_store
+
+    def get_lesson(self, lesson_id):
+        return self.open_lesson_store().get_lesson(lesson_id)
+
+    def get_question(self, qid):
+        return self.open_lesson_store().get_question(qid)
 
+    def lessons(self, streaming=False):
+        if streaming and not self.dataset:
+            return stream_lessons(self.data_json_file)
+        if not self.dataset:
+            self.load_dataset()
+        return iter(self.dataset)
+
+    def lesson_question_lookup(self, lesson):
         nd_questions = {}
-        for lesson in non_diagram_questions:
-            for lesson_questions in lesson:
-                for question_id, question in lesson_questions.items():
-                    nd_questions[question_id] = question
         d_questions = {}
-        for lesson in diagram_questions:
-            for lesson_questions in lesson:
-                for question_id, question in lesson_questions.items():
-                    d_questions[question_id] = question
-        diagrams_by_type = self.select_nd_mc_questions({'diagramQuestions': d_questions, 'nonDiagramQuestions': nd_questions})
+        found = self.extract_keys(['nonDiagramQuestions', 'diagramQuestions'], lesson)
+        for lesson_questions in found['nonDiagramQuestions']:
+            nd_questions.update(lesson_questions)
+        for lesson_questions in found['diagramQuestions']:
+            d_questions.update(lesson_questions)
+        return self.select_nd_mc_questions({'diagramQuestions': d_questions, 'nonDiagramQuestions': nd_questions})
+
+    @profiler.profiled()
+    def build_question_lookup(self, by_type=False, streaming=False, compact=False):
+        diagrams_by_type = {'diagramQuestions': {}, 'nonDiagramQuestions': {}}
+        text_pool = {}
+        for lesson in self.lessons(streaming):
+            for question_type, questions in self.lesson_question_lookup(lesson).items():
+                if compact:
+                    questions = {qid: Question.from_json(qid, question, lesson['globalID'], text_pool)
+                                 for qid, question in questions.items()}
+                diagrams_by_type[question_type].update(questions)
         if by_type:
             return diagrams_by_type
         else:
@@ -0,0 +1,101 @@
+from __future__ import division
+import numpy as np
+from tabulate import tabulate
+
+
+def adjust_p_values(p_values, method='holm'):
+    p_values = np.asarray(p_values, dtype=np.float64)
+    n_tests = len(p_values)
+    if not method or not n_tests:
+        return p_values
+    order = np.argsort(p_values)
+    ranked = p_values[order]
+    if method == 'holm':
+        adjusted = np.maximum.accumulate(ranked * (n_tests - np.arange(n_tests)))
+    elif method == 'bonferroni':
+        adjusted = ranked * n_tests
+    elif method == 'bh':
+        adjusted = np.minimum.accumulate((ranked * n_tests / np.arange(1, n_tests + 1))[::-1])[::-1]
+    else:
+        raise ValueError('unknown correction method {}'.format(method))
+    result = np.empty(n_tests)
+    result[order] = np.minimum(adjusted, 1.0)
+    return result
+
+
+class SubmissionComparer(object):
+    """
+    paired comparisons between submissions scored by one EvaluationSession
+
+    all pairs are computed at once per table cell: the discordant counts come
+    from one matrix product of the submissions x questions correctness matrix
+    """
+    def __init__(self, session, n_resamples=1000, correction='holm', seed=None):
+        self.session = session
+        self.n_resamples = n_resamples
+        self.correction = correction
+        self.random_state = np.random.RandomState(seed)
+
+    def correctness_matrix(self, prediction_paths):
+        scored = [self.session.score(path) for path in prediction_paths]
+        names = [submission.name for submission in scored]
+        engine = self.session.engines['type']
+        return names, np.vstack([engine.correctness(submission.predicted) for submission in scored])
+
+    def compare(self, prediction_paths):
+        names, correctness = self.correctness_matrix(prediction_paths)
+        comparisons = []
+        for grouping, engine in sorted(self.session.engines.items()):
+            cells = [(name, engine.group_codes == idx) for idx, name in enumerate(engine.group_names)]
+            cells.append(('overall', engine.group_codes >= 0))
+            for cell, in_cell in cells:
+                if in_cell.any():
+                    comparisons += self.compare_cell(names, correctness[:, in_cell], grouping, cell)
+        return comparisons
+
+    def compare_cell(self, names, correctness, grouping, cell):
+        from scipy import stats
+        n_questions = correctness.shape[1]
+        as_float = correctness.astype(np.float64)
+        only_first = np.dot(as_float, 1 - as_float.T)
+        first, second = np.triu_indices(len(names), 1)
+        b = only_first[first, second]
+        c = only_first[second, first]
+        accuracy = as_float.sum(axis=1) / n_questions
+        mcnemar_p = np.where(b + c > 0, np.minimum(1.0, 2 * stats.binom.cdf(np.minimum(b, c), b + c, 0.5)), 1.0)
+        bootstrap_p = self.paired_bootstrap_p(b, c, n_questions)
+        adjusted_p = adjust_p_values(mcnemar_p, self.correction)
+        rows = []
+        for idx in range(len(b)):
+            rows.append({
+                'grouping': grouping,
+                'cell': cell,
+                'first': names[first[idx]],
+                'second': names[second[idx]],
+                'first accuracy': accuracy[first[idx]],
+                'second accuracy': accuracy[second[idx]],
+                'difference': accuracy[first[idx]] - accuracy[second[idx]],
+                'only first correct': int(b[idx]),
+                'only second correct': int(c[idx]),
+                'mcnemar p': mcnemar_p[idx],
+                'bootstrap p': bootstrap_p[idx],
+                'adjusted p': adjusted_p[idx]
+            })
+        return rows
+
+    def paired_bootstrap_p(self, b, c, n_questions):
+        # resampling questions only changes how many discordant questions of
+        # each kind are drawn, so the two counts are drawn as a multinomial
+        size = (self.n_resamples, len(b))
+        draws_b = self.random_state.binomial(n_questions, b / n_questions, size=size)
+        rest = n_questions - b
+        draws_c = self.random_state.binomial(n_questions - draws_b, np.divide(c, rest, out=np.zeros_like(c), where=rest > 0))
+        differences = draws_b - draws_c
+        p_value = 2 * np.minimum((differences <= 0).mean(axis=0), (differences >= 0).mean(axis=0))
+        return np.where(b == c, 1.0, np.minimum(p_value, 1.0))
+
+    def print_comparison(self, comparisons):
+        headers = ['grouping', 'cell', 'first', 'second', 'difference', 'only first correct', 'only second correct',
+                   'mcnemar p', 'bootstrap p', 'adjusted p']
+        table = [[row[header] for header in headers] for row in comparisons]
+        print(tabulate(table, headers, tablefmt="fancy_grid", floatfmt=".3f"))
@@ -3,69 +3,118 @@ import pandas as pd
 import numpy as np
 import json
 from collections import defaultdict
-from collections import Counter
-import string
 from tabulate import tabulate
+from .profiling import profiler
 from .common_utils import DataSetCommonTools
+from .answer_key import AnswerKey
+from .scoring import ScoringEngine
+from .submissions import SubmissionReader, answer_format_errors, is_streaming_submission
 
 
 class Evaluator(DataSetCommonTools):
-    def __init__(self, data_json_file):
+    def __init__(self, data_json_file, answer_key_file=None, verify_answer_key=False, compact=False):
         super(Evaluator, self).__init__(data_json_file)
         self.dataset = None
+        self.compact = compact
+        self.answer_key = None
+        if answer_key_file:
+            self.answer_key = AnswerKey.load(answer_key_file)
+            if verify_answer_key:
+                self.answer_key.check_dataset(data_json_file)
 
-    def evaluate_model(self, predicted_answers):
+    @profiler.profiled()
+    def evaluate_model(self, predicted_answers, fail_fast=False, bootstrap=None, breakdowns=None, chance=None):
+        if is_streaming_submission(predicted_answers):
+            return self.evaluate_submission_stream(predicted_answers, fail_fast, bootstrap, breakdowns, chance)
         if isinstance(predicted_answers, str):
             with open(predicted_answers, 'r') as f:
                 predicted_answers = json.load(f)
-        if not self.dataset:
+        if self.answer_key is not None:
+            return self.evaluate_with_answer_key(predicted_answers, bootstrap, breakdowns, chance)
+        if not self.dataset and not self.compact:
             self.load_dataset()
-        total_answered_counts, overall_expected_score = self.validate_answer_format(predicted_answers)
-        questions_by_type = self.build_question_lookup(by_type=True)
-        questions_by_subtype = self.build_questions_by_subtype(questions_by_type['nonDiagramQuestions'])
-        self.print_results(self.tabulate_results_by_type(questions_by_type, predicted_answers, overall_expected_score, total_answered_counts))
+        questions_by_type = self.build_question_lookup(by_type=True, streaming=self.compact, compact=self.compact)
+        all_dataset_questions = {**questions_by_type['diagramQuestions'], **questions_by_type['nonDiagramQuestions']}
+        total_answered_counts, overall_expected_score = self.validate_answer_format(predicted_answers, all_dataset_questions)
+        if bootstrap or breakdowns or chance:
+            answer_key = AnswerKey.from_dataset(self.data_json_file, self, content_hash=False)
+        else:
+            answer_key = AnswerKey.from_questions(questions_by_type)
+        engines = self.answer_key_engines(answer_key)
+        correctness = engines['type'].correctness(engines['type'].encode(predicted_answers))
+        self.print_results(engines['type'].tabulate(correctness, overall_expected_score, total_answered_counts, bootstrap,
+                                                    chance))
         print('Non-Diagram Question Type Breakdown')
-        self.print_results(self.tabulate_results_by_type(questions_by_subtype, predicted_answers, overall_expected_score))
+        self.print_results(engines['subtype'].tabulate(correctness, overall_expected_score, bootstrap=bootstrap,
+                                                       chance=chance))
+        self.print_chance_population(chance)
+        self.print_breakdowns(answer_key, correctness, overall_expected_score, breakdowns, bootstrap, chance)
         return
 
-    def tabulate_results_by_type(self, questions_by_type, predicted_answers, overall_expected_score, total_answered_counts=0,):
-        results = []
-        expected_totals = {}
-        expected_by_chance = {}
-        for question_type, questions in questions_by_type.items():
-            expected_totals[question_type] = len(questions)
-            expected_by_chance[question_type] = self.expected_score_by_chance(questions.values())
-            for q_id, answer in predicted_answers.items():
-                if q_id in questions.keys():
-                    if self.answered_correctly(questions, q_id, answer):
-                        results.append(question_type)
-        correct_by_type = Counter(results)
-        correct_by_type['overall'] = sum(correct_by_type.values())
-        accuracies = self.compute_accuracies(correct_by_type, questions_by_type)
-        expected_totals['overall'] = sum(expected_totals.values())
-        expected_by_chance['overall'] = overall_expected_score
-        results_to_tabulate = {
-            'accuracy': accuracies,
-            'total correct': correct_by_type,
-            'number of questions expected': expected_totals,
-            'baseline accuracy (random guesses)': expected_by_chance
+    @profiler.profiled()
+    def evaluate_with_answer_key(self, predicted_answers, bootstrap=None, breakdowns=None, chance=None):
+        errors = self.check_answer_format(predicted_answers)
+        engines = self.answer_key_engines()
+        predicted = engines['type'].encode(predicted_answers)
+        self.report_validation(errors, self.answer_key.qids(np.flatnonzero(predicted == 0)))
+        total_answered_counts = self.count_answered_by_type(predicted_answers)
+        overall_expected_score = self.answer_key.chance_scores().mean()
+        correctness = engines['type'].correctness(predicted)
+        self.print_results(engines['type'].tabulate(correctness, overall_expected_score, total_answered_counts, bootstrap,
+                                                    chance))
+        print('Non-Diagram Question Type Breakdown')
+        self.print_results(engines['subtype'].tabulate(correctness, overall_expected_score, bootstrap=bootstrap,
+                                                       chance=chance))
+        self.print_chance_population(chance)
+        self.print_breakdowns(self.answer_key, correctness, overall_expected_score, breakdowns, bootstrap, chance)
+        return
+
+    @profiler.profiled()
+    def evaluate_submission_stream(self, submission_path, fail_fast=False, bootstrap=None, breakdowns=None, chance=None):
+        if self.answer_key is None:
+            self.answer_key = AnswerKey.from_dataset(self.data_json_file, self, content_hash=False)
+        engines = self.answer_key_engines()
+        predicted, report = SubmissionReader(self.answer_key, fail_fast).read(submission_path)
+        self.report_validation(report.errors_by_qid(), self.answer_key.qids(np.flatnonzero(predicted == 0)))
+        overall_expected_score = self.answer_key.chance_scores().mean()
+        correctness = engines['type'].correctness(predicted)
+        self.print_results(engines['type'].tabulate(correctness, overall_expected_score, dict(report.answered_counts),
+                                                    bootstrap, chance))
+        print('Non-Diagram Question Type Breakdown')
+        self.print_results(engines['subtype'].tabulate(correctness, overall_expected_score, bootstrap=bootstrap,
+                                                       chance=chance))
+        self.print_chance_population(chance)
+        self.print_breakdowns(self.answer_key, correctness, overall_expected_score, breakdowns, bootstrap, chance)
+        return report
+
+    def print_breakdowns(self, answer_key, correctness, overall_expected_score, breakdowns, bootstrap=None, chance=None):
+        for dimensions in breakdowns or []:
+            engine = ScoringEngine.from_dimensions(answer_key, dimensions)
+            print('{} Breakdown'.format(' x '.join(dimensions)))
+            self.print_results(engine.tabulate(correctness, overall_expected_score, bootstrap=bootstrap, chance=chance))
+
+    def print_chance_population(self, chance):
+        if chance is not None:
+            print('chance percentiles and p-value in the overall row cover the question types above; '
+                  'the baseline accuracy covers all questions')
+
+    def answer_key_engines(self, answer_key=None, subtypes=None):
+        if not subtypes:
+            subtypes = ["True or False", "Multiple Choice", "Matching"]
+        answer_key = answer_key or self.answer_key
+        subtype_lookup = np.array([subtypes.index(st) if st in subtypes else -1 for st in answer_key.subtypes])
+        is_nd = answer_key.qtype == answer_key.question_types.index('nonDiagramQuestions')
+        return {
+            'type': ScoringEngine(answer_key, answer_key.qtype, answer_key.question_types),
+            'subtype': ScoringEngine(answer_key, np.where(is_nd, subtype_lookup[answer_key.subtype], -1), subtypes)
         }
-        if total_answered_counts:
-            total_answered_counts['overall'] = sum(total_answered_counts.values())
-            results_to_tabulate['number of questions answered'] = total_answered_counts
-        return results_to_tabulate
-
-    def compute_accuracies(self, correct_by_type, questions_by_type):
-        accuracy_by_type = {}
-        for q_type, number_correct in correct_by_type.items():
-            if q_type != 'overall':
-                accuracy_by_type[q_type] = number_correct / len(questions_by_type[q_type])
-            else:
-                accuracy_by_type[q_type] = number_correct / sum([len(v) for v in questions_by_type.values()])
-        return accuracy_by_type
-
-    def answered_correctly(self, questions_for_type, q_id, answer):
-        return answer == questions_for_type[q_id]['correctAnswer']['processedText']
+
+    @profiler.profiled()
+    def tabulate_results_by_type(self, questions_by_type, predicted_answers, overall_expected_score, total_answered_counts=0,
+                                 bootstrap=None, answer_key=None, chance=None):
+        engine = ScoringEngine.from_question_groups(questions_by_type, answer_key)
+        correctness = engine.correctness(engine.encode(predicted_answers))
+        return engine.tabulate(correctness, overall_expected_score, total_answered_counts, bootstrap, chance)
 
     def expected_score_by_chance(self, q_series):
         total_q_n = len(q_series)
@@ -75,19 +124,31 @@ class Evaluator(DataSetCommonTools):
         expected_score = sum(ac_lengths_inv) / total_q_n
         return expected_score
 
-    def validate_answer_format(self, predicted_answers):
+    def check_answer_format(self, predicted_answers):
         errors = defaultdict(list)
         for qid, answer in predicted_answers.items():
-            id_prefix, id_number = qid.split('_')
-            if id_prefix not in ['DQ', 'NDQ']:
-                errors[qid].append('bad id prefix')
-            if len(id_number) != 6:
-                errors[qid].append('bad id number')
-            if answer not in string.ascii_letters:
-                errors[qid].append('answer not a letter index')
-        all_dataset_questions = self.build_question_lookup()
+            errors[qid].extend(answer_format_errors(qid, answer))
+            if not errors[qid]:
+                del errors[qid]
+        return errors
+
+    def count_answered_by_type(self, predicted_answers):
+        return {
+            'diagramQuestions': len([qid for qid in predicted_answers if qid[0] == 'D']),
+            'nonDiagramQuestions': len([qid for qid in predicted_answers if qid[0] == 'N'])
+        }
+
+    @profiler.profiled()
+    def validate_answer_format(self, predicted_answers, all_dataset_questions=None):
+        errors = self.check_answer_format(predicted_answers)
+        if all_dataset_questions is None:
+            all_dataset_questions = self.build_question_lookup()
         overall_expected_score = self.expected_score_by_chance(all_dataset_questions.values())
         questions_missing = set(all_dataset_questions.keys()).difference(set(predicted_answers.keys()))
+        self.report_validation(errors, questions_missing)
+        return self.count_answered_by_type(predicted_answers), overall_expected_score
+
+    def report_validation(self, errors, questions_missing):
         if questions_missing:
             print('***Warning***')
             print('unanswered questions detected')
@@ -100,21 +161,19 @@ class Evaluator(DataSetCommonTools):
             print('errors found ')
             for qid, error in errors.items():
                 print(qid, ' ', error)
-        answered_questions_total = {
-            'diagramQuestions': len([qid for qid in predicted_answers if qid[0] == 'D']),
-            'nonDiagramQuestions': len([qid for qid in predicted_answers if qid[0] == 'N'])
-        }
-        return answered_questions_total, overall_expected_score
 
     def build_questions_by_subtype(self, nd_questions, subtypes=None):
         if not subtypes:
             subtypes = ["True or False", "Multiple Choice", "Matching"]
         questions_by_subtype = defaultdict(dict)
         for sub_type in subtypes:
-            questions_by_subtype[sub_type] = {qid: question for qid, question in nd_questions.items()
-                                              if question['questionSubType'] == sub_type}
+            questions_by_subtype[sub_type] = {}
+        for qid, question in nd_questions.items():
+            if question['questionSubType'] in questions_by_subtype:
+                questions_by_subtype[question['questionSubType']][qid] = question
         return questions_by_subtype
 
+    @profiler.profiled()
     def print_results(self, results):
         build_results = defaultdict(list)
         headers = ['question type'] + list(sorted(results.keys()))
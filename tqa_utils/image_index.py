@@ -0,0 +1,64 @@
+import os
+import json
+from multiprocessing.pool import ThreadPool
+
+
+class ImagePathIndex(object):
+    """
+    answers file existence checks from one directory listing per directory
+
+    listings can be scanned over a thread pool and persisted to a snapshot file,
+    where they are reused for as long as the directory's mtime is unchanged
+    """
+    def __init__(self, snapshot_file=None, workers=1):
+        self.snapshot_file = snapshot_file
+        self.workers = workers
+        self.listings = {}
+        self.snapshot = {}
+        if snapshot_file and os.path.exists(snapshot_file):
+            with open(snapshot_file, 'r') as f:
+                self.snapshot = json.load(f)
+
+    def list_directory(self, directory):
+        try:
+            mtime = os.stat(directory).st_mtime
+        except OSError:
+            return directory, None, frozenset()
+        cached = self.snapshot.get(directory)
+        if cached and cached['mtime'] == mtime:
+            return directory, mtime, frozenset(cached['files'])
+        return directory, mtime, frozenset(entry.name for entry in os.scandir(directory))
+
+    def scan(self, directories):
+        directories = [directory for directory in set(directories) if directory not in self.listings]
+        if self.workers > 1 and len(directories) > 1:
+            pool = ThreadPool(min(self.workers, len(directories)))
+            try:
+                listings = pool.map(self.list_directory, directories)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            listings = [self.list_directory(directory) for directory in directories]
+        for directory, mtime, files in listings:
+            self.listings[directory] = files
+            if mtime is not None:
+                self.snapshot[directory] = {'mtime': mtime, 'files': sorted(files)}
+            else:
+                self.snapshot.pop(directory, None)
+
+    def exists(self, file_path):
+        directory, file_name = os.path.split(file_path)
+        if directory not in self.listings:
+            self.scan([directory])
+        return file_name in self.listings[directory]
+
+    def missing(self, file_paths):
+        file_paths = list(file_paths)
+        self.scan(os.path.dirname(file_path) for file_path in file_paths)
+        return [file_path for file_path in file_paths if not self.exists(file_path)]
+
+    def save(self):
+        if self.snapshot_file:
+            with open(self.snapshot_file, 'w') as f:
+                json.dump(self.snapshot, f)
@@ -1,43 +1,60 @@
 from .common_utils import DataSetCommonTools
+from .answer_key import dataset_content_hash
 from collections import defaultdict
+import os
+import pickle
+import multiprocessing
 import random
+import numpy as np
+
+_worker_model = None
+
+
+def _init_predictor(model_class, model_args):
+    global _worker_model
+    _worker_model = model_class(*model_args)
+
+
+def _answer_batch(questions):
+    return _worker_model.answer_questions(questions)
 
 
 class SimpleModels(DataSetCommonTools):
-    def __init__(self, data_file):
+    def __init__(self, data_file, compact=False):
         super(SimpleModels, self).__init__(data_file)
         self.predictions = defaultdict(list)
+        self.compact = compact
 
     def get_questions(self):
-        if not self.dataset:
+        if not self.dataset and not self.compact:
             self.load_dataset()
-        all_questions = {}
-        question_types = ['nonDiagramQuestions', 'diagramQuestions']
-        for q_type in question_types:
-            type_questions = [list(self.dict_key_extract(q_type, lesson)) for lesson in self.dataset]
-            nd_questions = {}
-            for lesson in type_questions:
-                for lesson_questions in lesson:
-                    for question_id, question in lesson_questions.items():
-                        nd_questions[question_id] = question
-            all_questions[q_type] = nd_questions
-        filtered_questions = self.select_nd_mc_questions(all_questions)
-        return filtered_questions
-
-
+        questions_by_type = self.build_question_lookup(by_type=True, streaming=self.compact, compact=self.compact)
+        return {q_type: questions_by_type[q_type] for q_type in ['nonDiagramQuestions', 'diagramQuestions']}
 
     def answer_question(self, question):
         return None
 
-    def make_predictions(self):
-        answers = {}
-        if not self.dataset:
-            self.load_dataset()
+    def answer_questions(self, questions):
+        return [self.answer_question(question) for question in questions]
+
+    def predictor_args(self):
+        return (self.data_json_file, self.compact)
+
+    def make_predictions(self, batch_size=1000, workers=1):
         all_questions = self.get_questions()
-        for question_type, questions in all_questions.items():
-            for qid, quest in questions.items():
-                answers[qid] = self.answer_question(quest)
-        return answers
+        qids = [qid for questions in all_questions.values() for qid in questions]
+        questions = [quest for questions in all_questions.values() for quest in questions.values()]
+        batches = [questions[start:start + batch_size] for start in range(0, len(questions), batch_size)]
+        if workers > 1:
+            pool = multiprocessing.Pool(workers, _init_predictor, (self.__class__, self.predictor_args()))
+            try:
+                batch_answers = pool.map(_answer_batch, batches)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            batch_answers = [self.answer_questions(batch) for batch in batches]
+        return dict(zip(qids, (answer for answers in batch_answers for answer in answers)))
 
 
 class Guesser(SimpleModels):
@@ -52,3 +69,102 @@ class Cheater(SimpleModels):
         return question['correctAnswer']['processedText']
 
 
+
+
+class RetrievalModel(SimpleModels):
+    """
+    picks the answer choice most similar to its lesson's text under a tf-idf index
+
+    every choice of every question is vectorized at once and scored against the
+    row of its own lesson with one elementwise sparse product
+    """
+    def __init__(self, data_file, index_file=None, compact=False, index=None):
+        super(RetrievalModel, self).__init__(data_file, compact)
+        self.index_file = index_file
+        self.vectorizer = None
+        self.lesson_vectors = None
+        self.question_lessons = {}
+        if index is not None:
+            self.vectorizer, self.lesson_vectors, self.question_lessons = index
+        else:
+            self.load_index()
+
+    @staticmethod
+    def lesson_text(lesson):
+        text = [topic['content']['text'] for topic in lesson['topics'].values()]
+        for name, adjunct_topic in lesson['adjunctTopics'].items():
+            if name == 'Vocabulary':
+                text += ['{} {}'.format(term, definition) for term, definition in adjunct_topic.items()]
+            else:
+                text.append(adjunct_topic['content']['text'])
+        return '\n'.join(text)
+
+    def build_index(self):
+        lesson_texts = []
+        for lesson_row, lesson in enumerate(self.lessons(streaming=self.compact)):
+            lesson_texts.append(self.lesson_text(lesson))
+            for questions in self.lesson_question_lookup(lesson).values():
+                for qid in questions:
+                    self.question_lessons[qid] = lesson_row
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        self.vectorizer = TfidfVectorizer(stop_words='english', sublinear_tf=True)
+        self.lesson_vectors = self.vectorizer.fit_transform(lesson_texts).tocsr()
+
+    def load_index(self):
+        if not self.index_file:
+            self.build_index()
+            return
+        dataset_hash = dataset_content_hash(self.data_json_file)
+        if os.path.exists(self.index_file):
+            with open(self.index_file, 'rb') as f:
+                index = pickle.load(f)
+            if index['dataset_sha256'] == dataset_hash:
+                self.vectorizer = index['vectorizer']
+                self.lesson_vectors = index['lesson_vectors']
+                self.question_lessons = index['question_lessons']
+                return
+        self.build_index()
+        index = {
+            'dataset_sha256': dataset_hash,
+            'vectorizer': self.vectorizer,
+            'lesson_vectors': self.lesson_vectors,
+            'question_lessons': self.question_lessons
+        }
+        with open(self.index_file, 'wb') as f:
+            pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def answer_questions(self, questions):
+        choice_texts = []
+        choice_letters = []
+        question_rows = []
+        choice_positions = []
+        lesson_rows = []
+        for question_row, question in enumerate(questions):
+            lesson_row = self.question_lessons[question['globalID']]
+            for position, letter in enumerate(sorted(question['answerChoices'])):
+                choice_texts.append(question['answerChoices'][letter]['processedText'])
+                choice_letters.append(letter)
+                question_rows.append(question_row)
+                choice_positions.append(position)
+                lesson_rows.append(lesson_row)
+        answers = [None] * len(questions)
+        if not choice_texts:
+            return answers
+        choice_vectors = self.vectorizer.transform(choice_texts)
+        scores = np.asarray(choice_vectors.multiply(self.lesson_vectors[lesson_rows]).sum(axis=1)).ravel()
+        score_table = np.full((len(questions), max(choice_positions) + 1), -np.inf)
+        score_table[question_rows, choice_positions] = scores
+        best_positions = score_table.argmax(axis=1)
+        first_choice = np.searchsorted(question_rows, np.arange(len(questions)))
+        for question_row, position in enumerate(best_positions):
+            if np.isfinite(score_table[question_row, position]):
+                answers[question_row] = choice_letters[first_choice[question_row] + position]
+        return answers
+
+    def answer_question(self, question):
+        return self.answer_questions([question])[0]
+
+    def predictor_args(self):
+        # workers take the fitted index as it is instead of loading or refitting it
+        return (self.data_json_file, self.index_file, self.compact,
+                (self.vectorizer, self.lesson_vectors, self.question_lessons))
@@ -0,0 +1,157 @@
+import time
+import functools
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+from tabulate import tabulate
+
+
+class Phase(object):
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.peak = 0
+        self.start_memory = 0
+        self.start = None
+
+    def __enter__(self):
+        self.profiler.enter(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.exit(self)
+        return False
+
+
+class ProfileReport(object):
+    """
+    per-phase call counts, total wall time and traced memory, in the order phases first ran
+    """
+    def __init__(self, phases, wall_seconds, peak_memory):
+        self.phases = phases
+        self.wall_seconds = wall_seconds
+        self.peak_memory = peak_memory
+
+    def as_dict(self):
+        return {
+            'wall_seconds': self.wall_seconds,
+            'peak_memory_mb': self.peak_memory / 2 ** 20 if self.peak_memory is not None else None,
+            'phases': [dict(stats, name=name) for name, stats in self.phases.items()]
+        }
+
+    def print_report(self):
+        headers = ['phase', 'calls', 'wall seconds', 'share of run', 'peak traced MB', 'allocated MB']
+        table = []
+        for name, stats in self.phases.items():
+            table.append([name, stats['calls'], stats['wall_seconds'],
+                          stats['wall_seconds'] / self.wall_seconds if self.wall_seconds else 0.0,
+                          stats['peak_memory_mb'], stats['allocated_mb']])
+        print(tabulate(table, headers, tablefmt="fancy_grid", floatfmt=".3f"))
+
+
+class Profiler(object):
+    """
+    times named phases and records their call counts and tracemalloc peaks
+
+    while disabled, profiled functions call straight through, so instrumented code
+    pays a single attribute check per call
+    """
+    def __init__(self):
+        self.enabled = False
+        self.trace_memory = False
+        self.started_tracing = False
+        self.phases = OrderedDict()
+        self.open_phases = []
+        self.started = None
+        self.peak_memory = None
+
+    def enable(self, trace_memory=True):
+        self.enabled = True
+        self.started = time.time()
+        self.trace_memory = trace_memory
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+
+    def disable(self):
+        self.enabled = False
+        if self.trace_memory and tracemalloc.is_tracing():
+            self.peak_memory = max(self.peak_memory or 0, tracemalloc.get_traced_memory()[1])
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    def reset(self):
+        self.phases = OrderedDict()
+        self.open_phases = []
+        self.started = time.time()
+        self.peak_memory = None
+
+    def profiled(self, name=None):
+        def decorate(func):
+            phase_name = name or func.__qualname__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with Phase(self, phase_name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def enter(self, phase):
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            for open_phase in self.open_phases:
+                open_phase.peak = max(open_phase.peak, peak)
+            # without reset_peak every phase reports the peak since tracing started
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            phase.start_memory = current
+            phase.peak = current
+        self.open_phases.append(phase)
+        phase.start = time.time()
+
+    def exit(self, phase):
+        wall_seconds = time.time() - phase.start
+        self.open_phases.remove(phase)
+        if self.trace_memory:
+            phase.peak = max(phase.peak, tracemalloc.get_traced_memory()[1])
+            for open_phase in self.open_phases:
+                open_phase.peak = max(open_phase.peak, phase.peak)
+            self.peak_memory = max(self.peak_memory or 0, phase.peak)
+        stats = self.phases.setdefault(phase.name, {'calls': 0, 'wall_seconds': 0.0, 'peak_memory_mb': None,
+                                                    'allocated_mb': None})
+        stats['calls'] += 1
+        stats['wall_seconds'] += wall_seconds
+        if self.trace_memory:
+            stats['peak_memory_mb'] = max(stats['peak_memory_mb'] or 0.0, phase.peak / 2 ** 20)
+            stats['allocated_mb'] = max(stats['allocated_mb'] or 0.0, (phase.peak - phase.start_memory) / 2 ** 20)
+
+    def report(self):
+        peak_memory = self.peak_memory
+        if self.enabled and self.trace_memory and tracemalloc.is_tracing():
+            peak_memory = max(peak_memory or 0, tracemalloc.get_traced_memory()[1])
+        return ProfileReport(OrderedDict((name, dict(stats)) for name, stats in self.phases.items()),
+                             time.time() - self.started if self.started else 0.0, peak_memory)
+
+
+profiler = Profiler()
+
+
+@contextmanager
+def profiling(enabled=True, trace_memory=True):
+    """
+    enables the shared profiler for the duration of the block and yields it, or None when not enabled
+    """
+    if not enabled:
+        yield None
+        return
+    profiler.reset()
+    profiler.enable(trace_memory)
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
@@ -0,0 +1,138 @@
+import sys
+
+
+def intern_text(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def shared_text(value, text_pool=None):
+    if text_pool is None or not isinstance(value, str):
+        return value
+    return text_pool.setdefault(value, value)
+
+
+class CompactRecord(object):
+    """
+    __slots__ record that can still be read with the dataset's json keys
+    """
+    __slots__ = ()
+    json_fields = {}
+
+    def __getitem__(self, key):
+        if key not in self.json_fields:
+            raise KeyError(key)
+        return getattr(self, self.json_fields[key])
+
+    def __contains__(self, key):
+        return key in self.json_fields and getattr(self, self.json_fields[key]) is not None
+
+    def get(self, key, default=None):
+        value = self[key] if key in self.json_fields else None
+        return default if value is None else value
+
+    def keys(self):
+        return [key for key in self.json_fields if key in self]
+
+    def as_dict(self):
+        return {key: self[key] for key in self.keys()}
+
+
+class AnswerChoice(CompactRecord):
+    __slots__ = ('letter', 'id_structural', 'raw_text', 'processed_text')
+    json_fields = {
+        'idStructural': 'id_structural',
+        'rawText': 'raw_text',
+        'processedText': 'processed_text'
+    }
+
+    def __init__(self, letter, id_structural, raw_text, processed_text):
+        self.letter = intern_text(letter)
+        self.id_structural = intern_text(id_structural)
+        self.raw_text = raw_text
+        self.processed_text = processed_text
+
+    @classmethod
+    def from_json(cls, letter, choice, text_pool=None):
+        return cls(letter, choice.get('idStructural'), shared_text(choice.get('rawText'), text_pool),
+                   shared_text(choice.get('processedText'), text_pool))
+
+
+class Question(CompactRecord):
+    """
+    compact stand-in for a question dict
+
+    categorical fields are interned, so the many copies of 'Multiple Choice' or 'a'
+    across the release share one string. answer texts are free text and go through a
+    text_pool dict instead, which the caller drops once its lookup is built
+    """
+    __slots__ = ('qid', 'lesson_id', 'question_type', 'sub_type', 'id_structural', 'raw_text', 'processed_text',
+                 'correct_raw_text', 'correct_processed_text', 'choices', 'image_path')
+    json_fields = {
+        'globalID': 'qid',
+        'questionType': 'question_type',
+        'questionSubType': 'sub_type',
+        'idStructural': 'id_structural',
+        'beingAsked': 'being_asked',
+        'correctAnswer': 'correct_answer',
+        'answerChoices': 'answer_choices',
+        'imagePath': 'image_path'
+    }
+
+    def __init__(self, qid, lesson_id, question_type, sub_type, id_structural, raw_text, processed_text,
+                 correct_raw_text, correct_processed_text, choices, image_path=None):
+        self.qid = qid
+        self.lesson_id = intern_text(lesson_id)
+        self.question_type = intern_text(question_type)
+        self.sub_type = intern_text(sub_type)
+        self.id_structural = intern_text(id_structural)
+        self.raw_text = raw_text
+        self.processed_text = processed_text
+        self.correct_raw_text = correct_raw_text
+        self.correct_processed_text = correct_processed_text
+        self.choices = tuple(choices)
+        self.image_path = image_path
+
+    @classmethod
+    def from_json(cls, qid, question, lesson_id=None, text_pool=None):
+        being_asked = question.get('beingAsked') or {}
+        correct_answer = question.get('correctAnswer') or {}
+        choices = [AnswerChoice.from_json(letter, choice, text_pool) for letter, choice in
+                   sorted((question.get('answerChoices') or {}).items())]
+        return cls(qid, lesson_id, question.get('questionType'), question.get('questionSubType'),
+                   question.get('idStructural'), being_asked.get('rawText'), being_asked.get('processedText'),
+                   shared_text(correct_answer.get('rawText'), text_pool),
+                   shared_text(correct_answer.get('processedText'), text_pool), choices, question.get('imagePath'))
+
+    @property
+    def being_asked(self):
+        return {'rawText': self.raw_text, 'processedText': self.processed_text}
+
+    @property
+    def correct_answer(self):
+        return {'rawText': self.correct_raw_text, 'processedText': self.correct_processed_text}
+
+    @property
+    def answer_choices(self):
+        return {choice.letter: choice for choice in self.choices}
+
+    @property
+    def choice_letters(self):
+        return [choice.letter for choice in self.choices]
+
+
+class LessonRecord(CompactRecord):
+    __slots__ = ('lesson_id', 'lesson_name', 'meta_lesson_id')
+    json_fields = {
+        'globalID': 'lesson_id',
+        'lessonName': 'lesson_name',
+        'metaLessonID': 'meta_lesson_id'
+    }
+
+    def __init__(self, lesson_id, lesson_name, meta_lesson_id):
+        self.lesson_id = intern_text(lesson_id)
+        self.lesson_name = lesson_name
+        self.meta_lesson_id = intern_text(meta_lesson_id)
+
+    @classmethod
+    def from_json(cls, lesson):
+        return cls(lesson['globalID'], lesson['lessonName'], lesson['metaLessonID'])
@@ -2,8 +2,17 @@ import os
 import json
 import jinja2
 import argparse
+import hashlib
+import itertools
+import multiprocessing
+from collections import defaultdict
+from .profiling import profiler
+from .common_utils import stream_lessons, LessonStore
 
 j2env = jinja2.Environment()
+compiled_templates = {}
+render_types = ['lessons', 'diagram_questions', 'diagram_descriptions', 'questions']
+MANIFEST_VERSION = 1
 
 default_page_html = """
 <!DOCTYPE html>
@@ -103,7 +112,7 @@ def make_lesson_wdq_data(lesson_json, rel_html_out_path, question_type='diagramQ
             else:
                 nested_text.append(' '.join([' ', ac['idStructural'], ac['processedText']]))
         nested_text.append('')
-        nested_text.append('&emsp;'.join(question['ocrResults']))
+        nested_text.append('&emsp;'.join(question.get('ocrResults', [])))
     return nested_text
 
 
@@ -142,7 +151,9 @@ def make_lesson_diagram_description_data(lesson_json, rel_html_out_path):
 
 
 def make_page_html(lesson_data, page_html):
-    return j2env.from_string(page_html).render(lesson=lesson_data[0], topics=lesson_data[1])
+    if page_html not in compiled_templates:
+        compiled_templates[page_html] = j2env.from_string(page_html)
+    return compiled_templates[page_html].render(lesson=lesson_data[0], topics=lesson_data[1])
 
 
 def display_lesson_html(lesson_json, lesson, page_type=None, html_output_dir=None):
@@ -169,39 +180,149 @@ def make_lesson_html(flexbook, lesson, page_html=default_page_html):
     return lesson_html
 
 
-def render_html_from_dataset(path_to_data_json):
-    with open(path_to_data_json, 'r') as f:
-        ck12_combined_dataset = json.load(f)
-    out_path = '../html_renders' 
-    render_types = ['lessons', 'diagram_questions', 'diagram_descriptions', 'questions']
+def lesson_file_stem(lesson):
+    return lesson['lessonName'].replace(' ', '_') + '_' + lesson['globalID']
+
+
+def render_output_files(lesson, render):
+    html_dir = os.path.join('html_renders', render)
+    if render == 'lessons':
+        return [os.path.join(html_dir, lesson_file_stem(lesson) + '.json'),
+                os.path.join(html_dir, lesson_file_stem(lesson) + '.html')]
+    elif render != 'questions' and not lesson['questions']['diagramQuestions']:
+        return []
+    return [os.path.join(html_dir, lesson_file_stem(lesson) + '.html')]
+
+
+def render_content_hash(lesson, render):
+    if render == 'lessons':
+        render_input = [default_page_html, lesson]
+    elif render == 'questions':
+        render_input = [diagram_page_html, lesson['lessonName'], lesson['globalID'], lesson['questions']['nonDiagramQuestions']]
+    elif render == 'diagram_questions':
+        render_input = [diagram_page_html, lesson['lessonName'], lesson['globalID'], lesson['questions']['diagramQuestions']]
+    else:
+        render_input = [diagram_page_html, lesson['lessonName'], lesson['globalID'], bool(lesson['questions']['diagramQuestions']),
+                        lesson['instructionalDiagrams']]
+    return hashlib.sha1(json.dumps([render] + render_input, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def render_lesson_files(lesson, out_path='../html_renders', renders=render_types):
+    for render in renders:
+        html_dir = os.path.join('html_renders', render)
+        if render == 'lessons':
+            json_out_file = os.path.join(html_dir, lesson_file_stem(lesson) + '.json')
+            with open(json_out_file, 'w') as f:
+                json.dump(lesson, f, indent=4, sort_keys=True)
+        elif render == 'questions':
+            pass
+        elif not lesson['questions']['diagramQuestions']:
+            continue
+        lesson_html = display_lesson_html(lesson, lesson['lessonName'], render, out_path)
+        html_out_file = os.path.join(html_dir, lesson_file_stem(lesson) + '.html')
+        with open(html_out_file, 'w') as f:
+            f.write(lesson_html.encode('ascii', 'ignore').decode('utf-8'))
+
+
+def update_lesson_renders(lesson, previous_entry=None, incremental=False):
+    previous_entry = previous_entry or {}
+    entry = {}
+    stale_renders = []
+    for render in render_types:
+        content_hash = render_content_hash(lesson, render)
+        output_files = render_output_files(lesson, render)
+        previous = previous_entry.get(render)
+        if incremental and previous and previous['hash'] == content_hash and all(os.path.exists(f) for f in output_files):
+            entry[render] = previous
+            continue
+        stale_renders.append(render)
+        entry[render] = {'hash': content_hash, 'files': output_files}
+    render_lesson_files(lesson, renders=stale_renders)
+    remove_outputs(previous_entry, entry)
+    return entry
+
+
+def remove_outputs(previous_entry, entry=None):
+    kept_files = set(f for render in (entry or {}).values() for f in render['files'])
+    for render in previous_entry.values():
+        for stale_file in render['files']:
+            if stale_file not in kept_files and os.path.exists(stale_file):
+                os.remove(stale_file)
+
+
+@profiler.profiled()
+def render_lesson_chunk(lessons_with_entries):
+    return [(lesson['globalID'], update_lesson_renders(lesson, previous_entry, incremental))
+            for lesson, previous_entry, incremental in lessons_with_entries]
+
+
+def chunk_lessons(lessons, chunk_size):
+    lessons = iter(lessons)
+    while True:
+        chunk = list(itertools.islice(lessons, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def load_manifest(manifest_file):
+    if not os.path.exists(manifest_file):
+        return {}
+    with open(manifest_file, 'r') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest['lessons']
+
+
+def write_manifest(manifest_file, lesson_entries):
+    with open(manifest_file + '.tmp', 'w') as f:
+        json.dump({'version': MANIFEST_VERSION, 'lessons': lesson_entries}, f, indent=1, sort_keys=True)
+    os.replace(manifest_file + '.tmp', manifest_file)
+
+
+@profiler.profiled()
+def render_html_from_dataset(path_to_data_json, streaming=False, workers=1, chunk_size=8, incremental=False):
+    if streaming:
+        ck12_combined_dataset = stream_lessons(path_to_data_json)
+    else:
+        with open(path_to_data_json, 'r') as f:
+            ck12_combined_dataset = json.load(f)
     for render in render_types:
         html_dir = os.path.join('html_renders', render)
         if not os.path.exists(html_dir):
             os.makedirs(html_dir)
-        for lesson in ck12_combined_dataset:
-            if render == 'lessons':
-                json_out_file = os.path.join(html_dir, lesson['lessonName'].replace(' ', '_') + '_' + lesson['globalID'] + '.json') 
-                with open(json_out_file, 'w') as f:
-                    json.dump(lesson, f, indent=4, sort_keys=True)
-            elif render == 'questions':
-                pass
-            elif not lesson['questions']['diagramQuestions']:
-                continue
-            lesson_html = display_lesson_html(lesson, lesson['lessonName'], render, out_path)
-            html_out_file = os.path.join(html_dir, lesson['lessonName'].replace(' ', '_') + '_' + lesson['globalID'] + '.html')
-            with open(html_out_file, 'w') as f:
-                f.write(lesson_html.encode('ascii', 'ignore').decode('utf-8'))
+    manifest_file = os.path.join('html_renders', 'manifest.json')
+    previous_entries = load_manifest(manifest_file)
+    work = ((lesson, previous_entries.get(lesson['globalID']), incremental) for lesson in ck12_combined_dataset)
+    lesson_entries = {}
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        try:
+            for rendered in pool.imap_unordered(render_lesson_chunk, chunk_lessons(work, chunk_size)):
+                lesson_entries.update(rendered)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for chunk in chunk_lessons(work, chunk_size):
+            lesson_entries.update(render_lesson_chunk(chunk))
+    for lesson_id, previous_entry in previous_entries.items():
+        if lesson_id not in lesson_entries:
+            remove_outputs(previous_entry)
+    write_manifest(manifest_file, lesson_entries)
+    return lesson_entries
 
 
-def render_sample_question_and_lesson(lesson, qid='', out_path='./sample_questions', ocr_res=None):
-    render_types = ['questions', 'diagram_questions', 'lessons', 'diagram_descriptions']
+def render_sample_lesson_html(lesson, out_path='./sample_questions'):
+    sample_render_types = ['questions', 'diagram_questions', 'lessons', 'diagram_descriptions']
     combined_sample_html = ''
-    for render in render_types:
+    for render in sample_render_types:
         html_dir = os.path.join('html_renders', render)
         if not os.path.exists(html_dir):
             os.makedirs(html_dir)
         if render == 'lessons':
-            json_out_file = os.path.join(html_dir, lesson['lessonName'].replace(' ', '_') + '_' + lesson['globalID'] + '.json')
+            json_out_file = os.path.join(html_dir, lesson_file_stem(lesson) + '.json')
             with open(json_out_file, 'w') as f:
                 json.dump(lesson, f, indent=4, sort_keys=True)
         elif render == 'questions':
@@ -210,6 +331,10 @@ def render_sample_question_and_lesson(lesson, qid='', out_path='./sample_questio
             continue
         lesson_html = display_lesson_html(lesson, lesson['lessonName'], render, out_path)
         combined_sample_html += lesson_html + '<br>'
+    return combined_sample_html
+
+
+def write_sample_page(combined_sample_html, qid, out_path='./sample_questions'):
     html_out_file = os.path.join(out_path, qid + '_w_context.html')
     if not os.path.exists(out_path):
         os.makedirs(out_path)
@@ -217,12 +342,39 @@ def render_sample_question_and_lesson(lesson, qid='', out_path='./sample_questio
         f.write(combined_sample_html.encode('ascii', 'ignore').decode('utf-8'))
 
 
+def render_sample_question_and_lesson(lesson, qid='', out_path='./sample_questions', ocr_res=None):
+    write_sample_page(render_sample_lesson_html(lesson, out_path), qid, out_path)
+
+
+@profiler.profiled()
+def render_sample_questions(path_to_data_json, qids, out_path='./sample_questions', store_file=None):
+    """
+    writes a context page for every qid, reading only the lessons they belong to from the lesson store
+    """
+    lesson_store = LessonStore.for_dataset(path_to_data_json, store_file)
+    qids_by_lesson = defaultdict(list)
+    not_found = []
+    for qid in qids:
+        if qid in lesson_store.question_lessons:
+            qids_by_lesson[lesson_store.question_lessons[qid]].append(qid)
+        else:
+            not_found.append(qid)
+    for lesson_id, lesson_qids in qids_by_lesson.items():
+        combined_sample_html = render_sample_lesson_html(lesson_store.get_lesson(lesson_id), out_path)
+        for qid in lesson_qids:
+            write_sample_page(combined_sample_html, qid, out_path)
+    return sorted(set(not_found))
+
+
 def main():
     parser = argparse.ArgumentParser(description='Generates HTML pages from the dataset for review')
     parser.add_argument('dataset', help='path to complete dataset', type=str)
+    parser.add_argument('--streaming', help='read the dataset one lesson at a time', action='store_true')
+    parser.add_argument('--workers', help='number of rendering processes', type=int, default=1)
+    parser.add_argument('--incremental', help='only re-render lessons whose content changed', action='store_true')
     args = parser.parse_args()
     data_path = args.dataset
-    render_html_from_dataset(data_path)
+    render_html_from_dataset(data_path, streaming=args.streaming, workers=args.workers, incremental=args.incremental)
    
 
 if __name__ == "__main__":
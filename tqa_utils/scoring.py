@@ -0,0 +1,96 @@
+from __future__ import division
+from collections import Counter
+import numpy as np
+from .answer_key import AnswerKey
+
+
+class ScoringEngine(object):
+    """
+    scores submissions as integer arrays aligned to the answer key's question order
+    """
+    def __init__(self, answer_key, group_codes, group_names):
+        self.answer_key = answer_key
+        self.group_codes = np.asarray(group_codes, dtype=np.int64)
+        self.group_names = list(group_names)
+        in_group = self.group_codes >= 0
+        n_groups = len(self.group_names)
+        self.totals = np.bincount(self.group_codes[in_group], minlength=n_groups)
+        self.chance = np.bincount(self.group_codes[in_group], weights=answer_key.chance_scores()[in_group],
+                                  minlength=n_groups)
+
+    @classmethod
+    def from_question_groups(cls, questions_by_group, answer_key=None):
+        if answer_key is None:
+            answer_key = AnswerKey.from_questions(questions_by_group)
+        group_codes = np.full(len(answer_key), -1, dtype=np.int64)
+        group_names = list(questions_by_group.keys())
+        for group_idx, questions in enumerate(questions_by_group.values()):
+            rows = answer_key.lookup(questions.keys())
+            group_codes[rows[rows >= 0]] = group_idx
+        return cls(answer_key, group_codes, group_names)
+
+    @classmethod
+    def from_dimensions(cls, answer_key, dimensions):
+        combined = np.zeros(len(answer_key), dtype=np.int64)
+        valid = np.ones(len(answer_key), dtype=bool)
+        dimension_labels = []
+        for dimension in dimensions:
+            codes, labels = answer_key.dimension(dimension)
+            valid &= codes >= 0
+            combined = combined * len(labels) + np.maximum(codes, 0)
+            dimension_labels.append(labels)
+        present, present_codes = np.unique(combined[valid], return_inverse=True)
+        group_codes = np.full(len(answer_key), -1, dtype=np.int64)
+        group_codes[valid] = present_codes
+        label_codes = np.unravel_index(present, [len(labels) for labels in dimension_labels])
+        group_names = [' / '.join(labels[code] for labels, code in zip(dimension_labels, codes))
+                       for codes in zip(*label_codes)]
+        return cls(answer_key, group_codes, group_names)
+
+    def encode(self, predicted_answers, unknown_qids=None):
+        rows = self.answer_key.lookup(predicted_answers.keys())
+        answers = self.answer_key.encode_answers(predicted_answers.values())
+        hit = rows >= 0
+        if unknown_qids is not None and not hit.all():
+            unknown_qids.update(qid for qid, found in zip(predicted_answers.keys(), hit) if not found)
+        predicted = np.zeros(len(self.answer_key), dtype=np.uint8)
+        predicted[rows[hit]] = answers[hit]
+        return predicted
+
+    def correctness(self, predicted):
+        return (predicted == self.answer_key.answer) & (predicted != 0)
+
+    def correct_counts(self, correctness):
+        in_group = self.group_codes >= 0
+        return np.bincount(self.group_codes[in_group], weights=correctness[in_group],
+                           minlength=len(self.group_names)).astype(np.int64)
+
+    def tabulate(self, correctness, overall_expected_score, total_answered_counts=0, bootstrap=None, chance=None):
+        correct = self.correct_counts(correctness)
+        results = self.tabulate_counts(correct, overall_expected_score, total_answered_counts)
+        if bootstrap is not None:
+            results.update(bootstrap.intervals(self, correctness))
+        if chance is not None:
+            results.update(chance.columns(self, correct))
+        return results
+
+    def tabulate_counts(self, correct, overall_expected_score, total_answered_counts=0):
+        group_names = self.group_names
+        correct_by_type = Counter({name: int(correct[idx]) for idx, name in enumerate(group_names) if correct[idx]})
+        correct_by_type['overall'] = sum(correct_by_type.values())
+        expected_totals = {name: int(self.totals[idx]) for idx, name in enumerate(group_names)}
+        expected_totals['overall'] = sum(expected_totals.values())
+        accuracies = {q_type: number_correct / expected_totals[q_type] for q_type, number_correct in correct_by_type.items()}
+        expected_by_chance = {name: self.chance[idx] / self.totals[idx] for idx, name in enumerate(group_names)
+                              if self.totals[idx]}
+        expected_by_chance['overall'] = overall_expected_score
+        results_to_tabulate = {
+            'accuracy': accuracies,
+            'total correct': correct_by_type,
+            'number of questions expected': expected_totals,
+            'baseline accuracy (random guesses)': expected_by_chance
+        }
+        if total_answered_counts:
+            total_answered_counts['overall'] = sum(total_answered_counts.values())
+            results_to_tabulate['number of questions answered'] = total_answered_counts
+        return results_to_tabulate
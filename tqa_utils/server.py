@@ -0,0 +1,143 @@
+import json
+import time
+import threading
+import urllib.request
+from collections import deque
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+import numpy as np
+from .session import EvaluationSession
+
+
+class EvaluationMetrics(object):
+    """
+    request counters and a rolling window of latencies
+    """
+    def __init__(self, window=1000):
+        self.lock = threading.Lock()
+        self.counts = {'requests': 0, 'scored': 0, 'errors': 0, 'rejected': 0}
+        self.in_flight = 0
+        self.latencies = deque(maxlen=window)
+
+    def record(self, outcome, latency=None):
+        with self.lock:
+            self.counts['requests'] += 1
+            self.counts[outcome] += 1
+            if latency is not None:
+                self.latencies.append(latency)
+
+    def summary(self):
+        with self.lock:
+            latencies = np.array(self.latencies)
+            summary = dict(self.counts, in_flight=self.in_flight)
+        if len(latencies):
+            summary['latency_ms'] = {
+                'mean': latencies.mean() * 1000,
+                'p50': np.percentile(latencies, 50) * 1000,
+                'p95': np.percentile(latencies, 95) * 1000,
+                'max': latencies.max() * 1000
+            }
+        return summary
+
+
+class EvaluationRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path == '/health':
+            self.send_json(200, {'status': 'ok', 'n_questions': len(self.server.session.answer_key)})
+        elif self.path == '/metrics':
+            self.send_json(200, self.server.metrics.summary())
+        else:
+            self.send_json(404, {'error': 'unknown endpoint {}'.format(self.path)})
+
+    def do_POST(self):
+        if self.path != '/evaluate':
+            self.send_json(404, {'error': 'unknown endpoint {}'.format(self.path)})
+            return
+        metrics = self.server.metrics
+        if not self.server.slots.acquire(timeout=self.server.queue_timeout):
+            metrics.record('rejected')
+            self.send_json(503, {'error': 'evaluator busy'})
+            return
+        start = time.time()
+        with metrics.lock:
+            metrics.in_flight += 1
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8'))
+            if 'path' in body:
+                scored = self.server.session.score(body['path'], fail_fast=body.get('fail_fast', False))
+            else:
+                scored = self.server.session.score(body['answers'], name=body.get('name'))
+        except (IOError, ValueError, KeyError, TypeError, AttributeError) as e:
+            metrics.record('errors')
+            self.send_json(400, {'error': str(e)})
+        else:
+            metrics.record('scored', time.time() - start)
+            self.send_json(200, scored.as_dict())
+        finally:
+            with metrics.lock:
+                metrics.in_flight -= 1
+            self.server.slots.release()
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class EvaluationServer(ThreadingMixIn, HTTPServer):
+    """
+    keeps an EvaluationSession resident and scores submissions posted to /evaluate
+    """
+    daemon_threads = True
+
+    def __init__(self, session, host='127.0.0.1', port=8765, max_concurrent=4, queue_timeout=5.0):
+        HTTPServer.__init__(self, (host, port), EvaluationRequestHandler)
+        self.session = session
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.queue_timeout = queue_timeout
+        self.metrics = EvaluationMetrics()
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(*self.server_address[:2])
+
+
+class EvaluationClient(object):
+
+    def __init__(self, url='http://127.0.0.1:8765', timeout=60):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def request(self, endpoint, payload=None):
+        data = json.dumps(payload).encode('utf-8') if payload is not None else None
+        req = urllib.request.Request(self.url + endpoint, data=data, headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(req, timeout=self.timeout) as response:
+            return json.loads(response.read().decode('utf-8'))
+
+    def evaluate(self, predicted_answers, name=None):
+        return self.request('/evaluate', {'answers': predicted_answers, 'name': name})
+
+    def evaluate_path(self, submission_path, fail_fast=False):
+        return self.request('/evaluate', {'path': submission_path, 'fail_fast': fail_fast})
+
+    def health(self):
+        return self.request('/health')
+
+    def metrics(self):
+        return self.request('/metrics')
+
+
+def serve(data_file, answer_key_file=None, host='127.0.0.1', port=8765, max_concurrent=4):
+    server = EvaluationServer(EvaluationSession(data_file, answer_key_file), host, port, max_concurrent)
+    print('serving evaluations at {}'.format(server.url))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
@@ -0,0 +1,162 @@
+import json
+import numpy as np
+from .evaluate import Evaluator
+from .answer_key import AnswerKey
+from .scoring import ScoringEngine
+from .submissions import SubmissionReader, answer_format_errors, is_streaming_submission
+
+
+class ScoredSubmission(object):
+    """
+    scoring results for one submission, plus the state needed to re-score it incrementally
+    """
+    def __init__(self, name, errors, predicted, correctness, correct_counts, answered_counts, unknown_qids, answer_key,
+                 report=None):
+        self.name = name
+        self.report = report
+        self.errors = errors
+        self.predicted = predicted
+        self.correctness = correctness
+        self.correct_counts = correct_counts
+        self.answered_counts = answered_counts
+        self.unknown_qids = unknown_qids
+        self.n_missing = int(np.count_nonzero(predicted == 0))
+        self.answer_key = answer_key
+        self.results = None
+
+    @property
+    def accuracy(self):
+        return self.results['type']['accuracy']['overall']
+
+    @property
+    def missing_qids(self):
+        return self.answer_key.qids(np.flatnonzero(self.predicted == 0))
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'results': {grouping: {column: dict(values) for column, values in table.items()}
+                        for grouping, table in self.results.items()},
+            'errors': dict(self.errors),
+            'n_missing': self.n_missing
+        }
+
+
+class EvaluationSession(Evaluator):
+    """
+    scores many submissions against one parsed dataset
+    """
+    def __init__(self, data_json_file, answer_key_file=None, bootstrap=None, chance=None):
+        super(EvaluationSession, self).__init__(data_json_file, answer_key_file)
+        if self.answer_key is None:
+            self.answer_key = AnswerKey.from_dataset(data_json_file, self, content_hash=False)
+        self.bootstrap = bootstrap
+        self.chance = chance
+        self.overall_expected_score = self.answer_key.chance_scores().mean()
+        self.engines = self.answer_key_engines()
+        self.breakdown_engines = {}
+
+    def score(self, predicted_answers, name=None, fail_fast=False):
+        if is_streaming_submission(predicted_answers):
+            return self.score_stream(predicted_answers, name, fail_fast)
+        if isinstance(predicted_answers, str):
+            name = name or predicted_answers
+            with open(predicted_answers, 'r') as f:
+                predicted_answers = json.load(f)
+        errors = self.check_answer_format(predicted_answers)
+        unknown_qids = set()
+        predicted = self.engines['type'].encode(predicted_answers, unknown_qids)
+        return self.make_scored(name, errors, predicted, self.count_answered_by_type(predicted_answers), unknown_qids)
+
+    def score_stream(self, submission_path, name=None, fail_fast=False):
+        predicted, report = SubmissionReader(self.answer_key, fail_fast).read(submission_path)
+        unknown_qids = set(error['qid'] for error in report.errors if error['error'] == 'unknown question id')
+        return self.make_scored(name or submission_path, report.errors_by_qid(), predicted, dict(report.answered_counts),
+                                unknown_qids, report)
+
+    def make_scored(self, name, errors, predicted, answered_counts, unknown_qids, report=None):
+        correctness = self.engines['type'].correctness(predicted)
+        correct_counts = {grouping: engine.correct_counts(correctness) for grouping, engine in self.engines.items()}
+        scored = ScoredSubmission(name, errors, predicted, correctness, correct_counts, answered_counts, unknown_qids,
+                                  self.answer_key, report)
+        scored.results = self.tabulate_scored(scored)
+        return scored
+
+    def tabulate_scored(self, scored):
+        results = {}
+        for grouping, engine in self.engines.items():
+            total_answered_counts = dict(scored.answered_counts) if grouping == 'type' else 0
+            results[grouping] = engine.tabulate_counts(scored.correct_counts[grouping], self.overall_expected_score,
+                                                       total_answered_counts)
+            if self.bootstrap is not None:
+                results[grouping].update(self.bootstrap.intervals(engine, scored.correctness))
+            if self.chance is not None:
+                results[grouping].update(self.chance.columns(engine, scored.correct_counts[grouping]))
+        return results
+
+    def breakdown(self, scored, dimensions):
+        dimensions = tuple(dimensions)
+        if dimensions not in self.breakdown_engines:
+            self.breakdown_engines[dimensions] = ScoringEngine.from_dimensions(self.answer_key, dimensions)
+        return self.breakdown_engines[dimensions].tabulate(scored.correctness, self.overall_expected_score,
+                                                           bootstrap=self.bootstrap, chance=self.chance)
+
+    def apply_patch(self, scored, patch):
+        qids = list(patch.keys())
+        answers = [patch[qid] for qid in qids]
+        rows = self.answer_key.lookup(qids)
+        codes = self.answer_key.encode_answers(answers)
+        for idx, (qid, answer) in enumerate(zip(qids, answers)):
+            scored.errors.pop(qid, None)
+            if answer is None:
+                codes[idx] = 0
+            elif answer_format_errors(qid, answer):
+                scored.errors[qid] = answer_format_errors(qid, answer)
+            if rows[idx] >= 0:
+                was_answered = scored.predicted[rows[idx]] != 0
+            else:
+                was_answered = qid in scored.unknown_qids
+                if answer is None:
+                    scored.unknown_qids.discard(qid)
+                else:
+                    scored.unknown_qids.add(qid)
+            self.update_answered_count(scored, qid, int(answer is not None) - int(was_answered))
+        known = rows >= 0
+        return self.update_rows(scored, rows[known], codes[known])
+
+    def rescore(self, scored, predicted_answers):
+        if isinstance(predicted_answers, str):
+            with open(predicted_answers, 'r') as f:
+                predicted_answers = json.load(f)
+        scored.unknown_qids = set()
+        predicted = self.engines['type'].encode(predicted_answers, scored.unknown_qids)
+        changed = np.flatnonzero(predicted != scored.predicted)
+        scored.errors = self.check_answer_format(predicted_answers)
+        scored.answered_counts = self.count_answered_by_type(predicted_answers)
+        self.update_rows(scored, changed, predicted[changed])
+        return scored
+
+    def update_answered_count(self, scored, qid, delta):
+        if qid[0] == 'D':
+            scored.answered_counts['diagramQuestions'] += delta
+        elif qid[0] == 'N':
+            scored.answered_counts['nonDiagramQuestions'] += delta
+
+    def update_rows(self, scored, rows, codes):
+        previous = scored.predicted[rows]
+        answers = self.answer_key.answer[rows]
+        now_correct = (codes == answers) & (codes != 0)
+        delta = now_correct.astype(np.int64) - scored.correctness[rows]
+        scored.n_missing += int(np.count_nonzero(codes == 0)) - int(np.count_nonzero(previous == 0))
+        scored.predicted[rows] = codes
+        scored.correctness[rows] = now_correct
+        for grouping, engine in self.engines.items():
+            group_codes = engine.group_codes[rows]
+            in_group = group_codes >= 0
+            scored.correct_counts[grouping] += np.bincount(group_codes[in_group], weights=delta[in_group],
+                                                           minlength=len(engine.group_names)).astype(np.int64)
+        scored.results = self.tabulate_scored(scored)
+        return scored
+
+    def score_many(self, prediction_paths, fail_fast=False):
+        return [self.score(path, fail_fast=fail_fast) for path in prediction_paths]
@@ -0,0 +1,146 @@
+import io
+import gzip
+import json
+import string
+from collections import defaultdict
+import numpy as np
+from .profiling import profiler
+
+STREAMING_SUFFIXES = ('.jsonl', '.jsonl.gz')
+
+
+def is_streaming_submission(path):
+    return isinstance(path, str) and path.endswith(STREAMING_SUFFIXES)
+
+
+def open_submission(path):
+    if path.endswith('.gz'):
+        return io.TextIOWrapper(gzip.open(path, 'rb'), encoding='utf-8')
+    return open(path, 'r')
+
+
+def answer_format_errors(qid, answer):
+    errors = []
+    id_prefix, _, id_number = qid.partition('_')
+    if id_prefix not in ['DQ', 'NDQ']:
+        errors.append('bad id prefix')
+    if len(id_number) != 6:
+        errors.append('bad id number')
+    if not isinstance(answer, str) or answer not in string.ascii_letters:
+        errors.append('answer not a letter index')
+    return errors
+
+
+class SubmissionValidationError(ValueError):
+    def __init__(self, report):
+        first_error = report.errors[0]
+        super(SubmissionValidationError, self).__init__('{} line {}: {}'.format(
+            report.path, first_error['line'], first_error['error']))
+        self.report = report
+
+
+class SubmissionReport(object):
+    """
+    structured validation report for a line-delimited submission
+    """
+    def __init__(self, path):
+        self.path = path
+        self.errors = []
+        self.n_lines = 0
+        self.n_answers = 0
+        self.answered_counts = {'diagramQuestions': 0, 'nonDiagramQuestions': 0}
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def add_error(self, line_no, qid, message):
+        self.errors.append({'line': line_no, 'qid': qid, 'error': message})
+
+    def errors_by_qid(self):
+        errors = defaultdict(list)
+        for error in self.errors:
+            errors[error['qid'] or 'line {}'.format(error['line'])].append(error['error'])
+        return errors
+
+    def as_dict(self):
+        return {
+            'path': self.path,
+            'n_lines': self.n_lines,
+            'n_answers': self.n_answers,
+            'answered_counts': dict(self.answered_counts),
+            'errors': list(self.errors)
+        }
+
+
+class SubmissionReader(object):
+    """
+    parses, validates and encodes a jsonl submission in one pass
+
+    each line holds one answer, {"qid": "NDQ_000001", "answer": "a"}, and may
+    carry extra fields such as per-choice scores, which are ignored
+    """
+    def __init__(self, answer_key, fail_fast=False, batch_size=10000):
+        self.answer_key = answer_key
+        self.fail_fast = fail_fast
+        self.batch_size = batch_size
+
+    @profiler.profiled()
+    def read(self, path):
+        report = SubmissionReport(path)
+        predicted = np.zeros(len(self.answer_key), dtype=np.uint8)
+        batch = []
+        with open_submission(path) as f:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                report.n_lines += 1
+                batch.append((line_no,) + self.parse_line(line))
+                if len(batch) >= self.batch_size:
+                    self.flush(batch, predicted, report)
+                    batch = []
+        self.flush(batch, predicted, report)
+        return predicted, report
+
+    def parse_line(self, line):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return None, None, ['malformed json']
+        if not isinstance(record, dict) or not isinstance(record.get('qid'), str) or 'answer' not in record:
+            return None, None, ['missing qid or answer']
+        qid, answer = record['qid'], record['answer']
+        return qid, answer, answer_format_errors(qid, answer)
+
+    def flush(self, batch, predicted, report):
+        """
+        looks up and encodes a batch of parsed lines, recording every error in line order
+        """
+        parsed = [(qid, answer) for _, qid, answer, _ in batch if qid is not None]
+        rows = self.answer_key.lookup([qid for qid, _ in parsed])
+        codes = self.answer_key.encode_answers([answer for _, answer in parsed])
+        rows_and_codes = zip(rows, codes)
+        for line_no, qid, answer, messages in batch:
+            for message in messages:
+                self.fail(report, line_no, qid, message)
+            if qid is None:
+                continue
+            row, code = next(rows_and_codes)
+            if row >= 0 and predicted[row]:
+                self.fail(report, line_no, qid, 'duplicate answer')
+                continue
+            if row < 0:
+                self.fail(report, line_no, qid, 'unknown question id')
+            else:
+                predicted[row] = code
+            report.n_answers += 1
+            if qid[0] == 'D':
+                report.answered_counts['diagramQuestions'] += 1
+            elif qid[0] == 'N':
+                report.answered_counts['nonDiagramQuestions'] += 1
+
+    def fail(self, report, line_no, qid, message):
+        report.add_error(line_no, qid, message)
+        if self.fail_fast:
+            raise SubmissionValidationError(report)
+        return None, None
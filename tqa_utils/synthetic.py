@@ -0,0 +1,178 @@
+import gzip
+import json
+import random
+from .common_utils import stream_lessons
+from .submissions import is_streaming_submission
+
+RELEASE_LESSONS = 1076
+
+science_words = ['energy', 'cell', 'plant', 'water', 'rock', 'mineral', 'atom', 'molecule', 'force', 'motion', 'heat',
+                 'light', 'sound', 'wave', 'orbit', 'planet', 'star', 'moon', 'soil', 'erosion', 'climate', 'weather',
+                 'ocean', 'river', 'glacier', 'volcano', 'earthquake', 'fossil', 'species', 'gene', 'protein', 'enzyme',
+                 'organ', 'tissue', 'blood', 'oxygen', 'carbon', 'nitrogen', 'electron', 'proton', 'magnet', 'circuit',
+                 'current', 'voltage', 'mass', 'density', 'pressure', 'gravity', 'friction', 'acceleration', 'habitat',
+                 'ecosystem', 'predator', 'prey', 'photosynthesis', 'respiration', 'nucleus', 'membrane', 'bacteria',
+                 'virus', 'fungus', 'seed', 'flower', 'root', 'leaf', 'stem', 'mantle', 'crust', 'core', 'atmosphere']
+
+# subtype, question type, choice count range and share of non diagram questions
+ndq_subtypes = [
+    ('True or False', 'Multiple Choice', (2, 2), 0.3),
+    ('Multiple Choice', 'Multiple Choice', (3, 4), 0.3),
+    ('Matching', 'Multiple Choice', (5, 7), 0.2),
+    ('Short Answer', 'Direct Answer', (0, 0), 0.1),
+    ('Fill in the Blank', 'Direct Answer', (0, 0), 0.1)
+]
+
+
+class SyntheticDatasetGenerator(object):
+    """
+    writes releases that conform to release_schema.tqa_schema at a multiple of the release size
+
+    lessons are generated and written one at a time, so memory does not grow with scale
+    """
+    def __init__(self, scale=1, seed=0, base_lessons=RELEASE_LESSONS, lessons_per_meta_lesson=3):
+        self.n_lessons = max(1, int(round(base_lessons * scale)))
+        self.lessons_per_meta_lesson = lessons_per_meta_lesson
+        self.random = random.Random(seed)
+        self.counters = {'T': 0, 'DD': 0, 'NDQ': 0, 'DQ': 0}
+
+    def next_id(self, prefix):
+        self.counters[prefix] += 1
+        return '{}_{:06d}'.format(prefix, self.counters[prefix])
+
+    def sentence(self, n_words):
+        return ' '.join(self.random.choice(science_words) for _ in range(n_words))
+
+    def make_topics(self, lesson_idx):
+        topics = {}
+        for topic_idx in range(self.random.randint(3, 8)):
+            topic_name = 'Topic {} {}'.format(lesson_idx, topic_idx)
+            figures = []
+            if self.random.random() < 0.4:
+                figures.append({'caption': self.sentence(6),
+                                'imagePath': 'textbook_images/{}_{}.png'.format(lesson_idx, topic_idx)})
+            text = '. '.join(self.sentence(12) for _ in range(self.random.randint(3, 10)))
+            topics[topic_name] = {
+                'globalID': self.next_id('T'),
+                'topicName': topic_name,
+                'content': {'text': text, 'figures': figures}
+            }
+        return topics
+
+    def make_adjunct_topics(self):
+        vocabulary = {}
+        for _ in range(self.random.randint(2, 8)):
+            vocabulary[self.random.choice(science_words)] = self.sentence(8)
+        return {
+            'Vocabulary': vocabulary,
+            'Lesson Summary': {'orderID': 't_1', 'content': {'text': self.sentence(40), 'figures': []}},
+            'Review': {'orderID': 't_2', 'content': {'text': self.sentence(30), 'figures': []}}
+        }
+
+    def make_choices(self, n_choices):
+        return {letter: {'idStructural': letter + '.', 'rawText': self.sentence(3), 'processedText': self.sentence(3)}
+                for letter in 'abcdefg'[:n_choices]}
+
+    def make_non_diagram_question(self):
+        subtype, question_type, choice_range, _ = self.random_subtype()
+        choices = self.make_choices(self.random.randint(*choice_range))
+        correct = self.random.choice(sorted(choices)) if choices else self.sentence(2)
+        qid = self.next_id('NDQ')
+        return qid, {
+            'globalID': qid,
+            'idStructural': '{}.'.format(self.counters['NDQ'] % 20 + 1),
+            'questionType': question_type,
+            'questionSubType': subtype,
+            'beingAsked': {'rawText': self.sentence(10), 'processedText': self.sentence(10)},
+            'correctAnswer': {'rawText': correct, 'processedText': correct},
+            'answerChoices': choices
+        }
+
+    def random_subtype(self):
+        draw = self.random.random()
+        for subtype in ndq_subtypes:
+            draw -= subtype[3]
+            if draw < 0:
+                return subtype
+        return ndq_subtypes[-1]
+
+    def make_diagram_question(self, lesson_idx):
+        qid = self.next_id('DQ')
+        correct = self.random.choice('abcd')
+        return qid, {
+            'globalID': qid,
+            'imagePath': 'question_images/{}_{}.png'.format(lesson_idx, self.counters['DQ']),
+            'imageName': '{}_{}.png'.format(lesson_idx, self.counters['DQ']),
+            'idStructural': '1.',
+            'questionType': 'Diagram Multiple Choice',
+            'beingAsked': {'rawText': self.sentence(8), 'processedText': self.sentence(8)},
+            'correctAnswer': {'rawText': correct, 'processedText': correct},
+            'answerChoices': self.make_choices(4)
+        }
+
+    def make_lesson(self, lesson_idx):
+        has_diagrams = self.random.random() < 0.5
+        instructional_diagrams = {}
+        diagram_questions = {}
+        if has_diagrams:
+            for diagram_idx in range(self.random.randint(1, 4)):
+                image_name = 'diagram_{}_{}.png'.format(lesson_idx, diagram_idx)
+                instructional_diagrams[image_name] = {
+                    'imageName': image_name,
+                    'imagePath': 'teaching_images/' + image_name,
+                    'globalID': self.next_id('DD'),
+                    'rawText': self.sentence(20),
+                    'processedText': self.sentence(20)
+                }
+            for _ in range(self.random.randint(5, 20)):
+                qid, question = self.make_diagram_question(lesson_idx)
+                diagram_questions[qid] = question
+        non_diagram_questions = dict(self.make_non_diagram_question() for _ in range(self.random.randint(5, 20)))
+        return {
+            'globalID': 'L_{:04d}'.format(lesson_idx + 1),
+            'lessonName': '{} {}'.format(self.random.choice(science_words), lesson_idx),
+            'metaLessonID': 'ML_{:04d}'.format(lesson_idx // self.lessons_per_meta_lesson + 1),
+            'topics': self.make_topics(lesson_idx),
+            'adjunctTopics': self.make_adjunct_topics(),
+            'instructionalDiagrams': instructional_diagrams,
+            'questions': {'nonDiagramQuestions': non_diagram_questions, 'diagramQuestions': diagram_questions}
+        }
+
+    def lessons(self):
+        for lesson_idx in range(self.n_lessons):
+            yield self.make_lesson(lesson_idx)
+
+    def write_dataset(self, data_file):
+        with open(data_file, 'w') as f:
+            f.write('[')
+            for lesson_idx, lesson in enumerate(self.lessons()):
+                if lesson_idx:
+                    f.write(',\n')
+                json.dump(lesson, f)
+            f.write(']\n')
+        return data_file
+
+
+def write_submission(data_file, submission_file, accuracy=0.5, answered_fraction=0.98, seed=0):
+    """
+    answers every multiple choice question of a release, correctly with probability accuracy
+    """
+    rng = random.Random(seed)
+    answers = []
+    for lesson in stream_lessons(data_file):
+        for questions in lesson['questions'].values():
+            for qid, question in questions.items():
+                letters = sorted(question['answerChoices'])
+                if not letters or rng.random() > answered_fraction:
+                    continue
+                correct = question['correctAnswer']['processedText']
+                wrong = [letter for letter in letters if letter != correct]
+                answers.append((qid, correct if rng.random() < accuracy or not wrong else rng.choice(wrong)))
+    if is_streaming_submission(submission_file):
+        with (gzip.open(submission_file, 'wt') if submission_file.endswith('.gz') else open(submission_file, 'w')) as f:
+            for qid, answer in answers:
+                f.write(json.dumps({'qid': qid, 'answer': answer}) + '\n')
+    else:
+        with open(submission_file, 'w') as f:
+            json.dump(dict(answers), f)
+    return len(answers)
@@ -1,34 +1,74 @@
 import os.path
+import itertools
+import multiprocessing
 from collections import defaultdict
 import warnings
 from sklearn.model_selection import train_test_split
 import numpy as np
 import jsonschema
+from .profiling import profiler
 from .common_utils import DataSetCommonTools
+from .image_index import ImagePathIndex
+from .records import LessonRecord
 from .release_schema import tqa_schema as tqa_schema
 
+_worker_validator = None
+_worker_max_depth = None
+
+
+def _init_schema_worker(lesson_schema, max_depth):
+    global _worker_validator, _worker_max_depth
+    _worker_validator = jsonschema.Draft4Validator(lesson_schema)
+    _worker_max_depth = max_depth
+
+
+def _validate_lesson_chunk(indexed_lessons):
+    return [lesson_schema_errors(_worker_validator, lesson, lesson_idx, _worker_max_depth)
+            for lesson_idx, lesson in indexed_lessons]
+
+
+def lesson_schema_errors(validator, lesson, lesson_idx, max_depth):
+    errors = []
+    for error in sorted(validator.iter_errors(lesson), key=lambda x: [str(p) for p in x.absolute_schema_path]):
+        errors.append([error.message, ([lesson_idx] + list(error.absolute_path))[:max_depth]])
+    return errors
+
 
 class DataSetIntegrityChecker(DataSetCommonTools):
     """
     validate tqa dataset
     """
-    def __init__(self, data_root_dir, data_file, schema=tqa_schema):
-        super(DataSetIntegrityChecker, self).__init__(data_root_dir, data_file)
+    def __init__(self, data_root_dir, data_file, schema=tqa_schema, image_index=None):
+        super(DataSetIntegrityChecker, self).__init__(data_file)
+        self.data_root_dir = data_root_dir
+        self.image_index = image_index or ImagePathIndex()
         self.schema = schema
+        self.lesson_validator = None
         self.max_depth = 4
         self.checks_to_make = {
             'global_ids': self.check_global_ids,
             'image_paths': self.check_image_paths
         }
+        self.check_keys = {
+            'global_ids': 'globalID',
+            'image_paths': 'imagePath'
+        }
         self.global_ids_seen = defaultdict(list)
 
-    def iterate_over_lessons(self):
+    @profiler.profiled()
+    def iterate_over_lessons(self, streaming=False, schema_errors=None, max_errors=None):
         errors = defaultdict(list)
-        for lesson in self.dataset:
+        for lesson_idx, lesson in enumerate(self.lessons(streaming)):
+            if schema_errors is not None and (max_errors is None or len(schema_errors) < max_errors):
+                schema_errors += self.validate_lesson_schema(lesson, lesson_idx)
+            found = self.extract_keys([self.check_keys[check_type] for check_type in self.checks_to_make
+                                       if check_type in self.check_keys], lesson)
             for check_type, check in self.checks_to_make.items():
-                errors_found = check(lesson)
+                errors_found = check(lesson, found)
                 if errors_found:
                     errors[check_type] += errors_found
+        if schema_errors is not None and max_errors is not None:
+            del schema_errors[max_errors:]
         self.check_global_counts()
         return errors
 
@@ -42,116 +82,202 @@ class DataSetIntegrityChecker(DataSetCommonTools):
                     print()
         return self.global_ids_seen
 
-    def validate_schema(self):
-        errors = []
+    @profiler.profiled()
+    def validate_schema(self, streaming=False, workers=1, max_errors=None, chunk_size=16):
+        return list(itertools.islice(self.iter_schema_errors(streaming, workers, chunk_size), max_errors))
+
+    def iter_schema_errors(self, streaming=False, workers=1, chunk_size=16):
+        indexed_lessons = enumerate(self.lessons(streaming))
+        if workers <= 1:
+            for lesson_idx, lesson in indexed_lessons:
+                for error in self.validate_lesson_schema(lesson, lesson_idx):
+                    yield error
+            return
+        chunks = iter(lambda: list(itertools.islice(indexed_lessons, chunk_size)), [])
+        pool = multiprocessing.Pool(workers, _init_schema_worker, (self.schema['items'], self.max_depth))
         try:
-            validator = jsonschema.Draft4Validator(self.schema)
-            for error in sorted(list(validator.iter_errors(self.dataset)), key=lambda x: x.absolute_schema_path[0]):
-                errors.append([error.message, list(error.absolute_path)[:self.max_depth]])
-        except jsonschema.ValidationError as e:
-            errors.append("Error in tqa_schema --%s-" + e.message)
-        return errors
+            for chunk_errors in pool.imap(_validate_lesson_chunk, chunks):
+                for lesson_errors in chunk_errors:
+                    for error in lesson_errors:
+                        yield error
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def validate_lesson_schema(self, lesson, lesson_idx):
+        if self.lesson_validator is None:
+            self.lesson_validator = jsonschema.Draft4Validator(self.schema['items'])
+        return lesson_schema_errors(self.lesson_validator, lesson, lesson_idx, self.max_depth)
 
-    def validate_dataset(self):
-        if not self.dataset:
-            self.load_dataset()
+    @profiler.profiled()
+    def validate_dataset(self, streaming=False, workers=1, max_errors=None):
         all_errors = {}
-        schema_errors = self.validate_schema()
+        if streaming and not self.dataset and workers <= 1:
+            schema_errors = []
+            lesson_errors = self.iterate_over_lessons(streaming, schema_errors, max_errors)
+        else:
+            if not streaming and not self.dataset:
+                self.load_dataset()
+            if self.image_index.workers > 1 and self.dataset and 'image_paths' in self.checks_to_make:
+                self.image_index.scan(os.path.dirname(file_path) for lesson in self.dataset
+                                      for file_path in self.image_file_paths(lesson))
+            schema_errors = self.validate_schema(streaming, workers, max_errors)
+            lesson_errors = self.iterate_over_lessons(streaming)
+        self.image_index.save()
         all_errors['tqa_schema'] = schema_errors
-        all_errors.update(self.iterate_over_lessons())
+        all_errors.update(lesson_errors)
         for errors in all_errors.values():
             if errors:
                 return all_errors
         return 'all validation test passed'
 
-    def check_global_ids(self, lesson):
-        this_lessons_keys = list(self.dict_key_extract('globalID', lesson))
+    def check_global_ids(self, lesson, found=None):
+        if found is None:
+            found = self.extract_keys(['globalID'], lesson)
+        this_lessons_keys = found['globalID']
         for k in this_lessons_keys:
             id_type = k.split('_')[0]
             id_num = k.split('_')[1]
             self.global_ids_seen[id_type].append(id_num)
 
-    def check_image_paths(self, lesson):
-        missing_images = []
-        image_paths = list(self.dict_key_extract('imagePath', lesson))
-        for rel_path in image_paths:
-            file_path = os.path.join(self.data_root_dir, rel_path)
-            if not os.path.exists(file_path):
-                missing_images.append(file_path)
-        return missing_images
+    def image_file_paths(self, lesson, found=None):
+        if found is None:
+            found = self.extract_keys(['imagePath'], lesson)
+        return [os.path.join(self.data_root_dir, rel_path) for rel_path in found['imagePath']]
+
+    def check_image_paths(self, lesson, found=None):
+        return self.image_index.missing(self.image_file_paths(lesson, found))
 
 
 class TestTrainSplitter(DataSetCommonTools):
 
-    def __init__(self, data_root_dir, data_file):
-        super(TestTrainSplitter, self).__init__(data_root_dir, data_file)
+    split_stats = [
+        ('n_text_questions', 'nonDiagramQuestions'),
+        ('n_diagram_questions', 'diagramQuestions'),
+        ('n_topics', 'topics'),
+        ('n_instructional_diagrams', 'instructionalDiagrams')
+    ]
+
+    def __init__(self, data_root_dir, data_file, compact=False):
+        super(TestTrainSplitter, self).__init__(data_file)
+        self.data_root_dir = data_root_dir
+        self.compact = compact
+        self.lesson_index = None
+        self.lesson_records = None
+        self.stat_matrix = None
+
+    @profiler.profiled()
+    def build_lesson_index(self):
+        keys_to_find = [id_to_find for stat_type, id_to_find in self.split_stats]
+        self.lesson_index = {}
+        self.lesson_records = []
+        lesson_stats = []
+        for lesson_row, lesson in enumerate(self.lessons(streaming=self.compact)):
+            self.lesson_index[lesson['globalID']] = lesson_row
+            self.lesson_records.append(LessonRecord.from_json(lesson))
+            found = self.extract_keys(keys_to_find, lesson)
+            lesson_stats.append([len(found[id_to_find][0]) for id_to_find in keys_to_find])
+        self.stat_matrix = np.array(lesson_stats, dtype=np.int64).reshape(-1, len(self.split_stats))
+        return self.lesson_index
+
+    def lesson_rows(self, lesson_ids):
+        if self.lesson_index is None:
+            self.build_lesson_index()
+        return [self.lesson_index[lesson_id] for lesson_id in lesson_ids]
 
     def make_debug(self, train_ids, test_ids ):
-        debug_train_assignments = []
-        for lesson_id in train_ids:
-            lesson_name = [lesson['lessonName'] for lesson in self.dataset if lesson['globalID'] == lesson_id][0]
-            lesson_meta_id = [lesson['metaLessonID'] for lesson in self.dataset if lesson['globalID'] == lesson_id][0]
-            debug_train_assignments.append((lesson_id, lesson_name, lesson_meta_id))
-        debug_test_assignments = []
-        for lesson_id in test_ids:
-            lesson_name = [lesson['lessonName'] for lesson in self.dataset if lesson['globalID'] == lesson_id][0]
-            lesson_meta_id = [lesson['metaLessonID'] for lesson in self.dataset if lesson['globalID'] == lesson_id][0]
-            debug_test_assignments.append((lesson_id, lesson_name, lesson_meta_id))
-        return {'train': debug_train_assignments, 'test': debug_test_assignments}
-
-    def perform_split(self, test_fraction=0.2, manual_assignments={}, debug=False):
-        if not self.dataset:
-            self.load_dataset()
-        meta_lessons = np.array(list(set([lesson['metaLessonID'] for lesson in self.dataset if lesson['metaLessonID']
-                                          not in manual_assignments.keys()])))
-        meta_train_lessons, meta_test_lessons = train_test_split(meta_lessons, test_size=test_fraction)
-        meta_train_lessons = meta_train_lessons.tolist()
-        meta_test_lessons = meta_test_lessons.tolist()
+        debug_assignments = {}
+        for split, lesson_ids in [('train', train_ids), ('test', test_ids)]:
+            lessons = [self.lesson_records[lesson_row] for lesson_row in self.lesson_rows(lesson_ids)]
+            debug_assignments[split] = [(lesson['globalID'], lesson['lessonName'], lesson['metaLessonID']) for lesson in lessons]
+        return debug_assignments
+
+    @profiler.profiled()
+    def perform_split(self, test_fraction=0.2, manual_assignments={}, debug=False, n_candidates=0, seed=None):
+        if self.lesson_index is None:
+            self.build_lesson_index()
+        if n_candidates:
+            meta_train_lessons, meta_test_lessons = self.search_meta_split(test_fraction, manual_assignments, n_candidates,
+                                                                           seed)
+        else:
+            meta_lessons = np.array(list(set([lesson['metaLessonID'] for lesson in self.lesson_records
+                                              if lesson['metaLessonID'] not in manual_assignments.keys()])))
+            meta_train_lessons, meta_test_lessons = train_test_split(meta_lessons, test_size=test_fraction)
+            meta_train_lessons = meta_train_lessons.tolist()
+            meta_test_lessons = meta_test_lessons.tolist()
         meta_train_lessons += [metalesson for metalesson, lesson_info in manual_assignments.items() if lesson_info['split'] == 'train']
         meta_test_lessons += [metalesson for metalesson, lesson_info in manual_assignments.items() if lesson_info['split'] == 'test']
+        meta_train_lessons = set(meta_train_lessons)
+        meta_test_lessons = set(meta_test_lessons)
 
-        train_lessons = [lesson['globalID'] for lesson in self.dataset if lesson['metaLessonID'] in meta_train_lessons]
-        test_lessons = [lesson['globalID'] for lesson in self.dataset if lesson['metaLessonID'] in meta_test_lessons]
+        train_lessons = [lesson['globalID'] for lesson in self.lesson_records if lesson['metaLessonID'] in meta_train_lessons]
+        test_lessons = [lesson['globalID'] for lesson in self.lesson_records if lesson['metaLessonID'] in meta_test_lessons]
         if debug:
             debug_info = self.make_debug(train_lessons, test_lessons)
         else:
             debug_info = None
         return {'train': train_lessons, 'test': test_lessons}, debug_info
 
+    @profiler.profiled()
+    def search_meta_split(self, test_fraction=0.2, manual_assignments={}, n_candidates=5000, seed=None, chunk_size=1000):
+        """
+        draws candidate metaLesson splits and keeps the one whose worst statistic test fraction is closest to the target
+
+        every candidate's test totals come from one product of its assignment mask
+        with the metaLesson x statistic count matrix
+        """
+        if self.lesson_index is None:
+            self.build_lesson_index()
+        lesson_meta_ids = [lesson['metaLessonID'] for lesson in self.lesson_records]
+        meta_lessons = sorted(set(lesson_meta_ids))
+        meta_rows = {meta_id: meta_row for meta_row, meta_id in enumerate(meta_lessons)}
+        meta_codes = np.array([meta_rows[meta_id] for meta_id in lesson_meta_ids])
+        n_lessons = np.ones((len(self.lesson_records), 1), dtype=np.int64)
+        lesson_stats = np.hstack([self.stat_matrix, n_lessons]).astype(np.float64)
+        meta_stats = np.zeros((len(meta_lessons), lesson_stats.shape[1]))
+        np.add.at(meta_stats, meta_codes, lesson_stats)
+        is_manual = np.array([meta_id in manual_assignments for meta_id in meta_lessons], dtype=bool)
+        is_manual_test = np.array([meta_id in manual_assignments and manual_assignments[meta_id]['split'] == 'test'
+                                   for meta_id in meta_lessons], dtype=bool)
+        free_meta = np.flatnonzero(~is_manual)
+        fixed_test = meta_stats[is_manual_test].sum(axis=0)
+        totals = np.maximum(meta_stats.sum(axis=0), 1)
+        n_test = int(np.ceil(test_fraction * len(free_meta)))
+        random_state = np.random.RandomState(seed)
+        best_score, best_test = np.inf, None
+        for start in range(0, n_candidates, chunk_size):
+            n_chunk = min(chunk_size, n_candidates - start)
+            drawn = random_state.rand(n_chunk, len(free_meta)).argsort(axis=1)[:, :n_test]
+            in_test = np.zeros((n_chunk, len(free_meta)), dtype=bool)
+            in_test[np.arange(n_chunk)[:, None], drawn] = True
+            fractions = (np.dot(in_test, meta_stats[free_meta]) + fixed_test) / totals
+            scores = np.abs(fractions - test_fraction).max(axis=1)
+            best = scores.argmin()
+            if scores[best] < best_score:
+                best_score, best_test = scores[best], in_test[best]
+        meta_test_lessons = [meta_lessons[meta_row] for meta_row in free_meta[best_test]]
+        meta_train_lessons = [meta_lessons[meta_row] for meta_row in free_meta[~best_test]]
+        return meta_train_lessons, meta_test_lessons
+
+    @profiler.profiled()
     def compute_split_stats(self, test_train_assignments, diagram_only=False):
-        if not self.dataset:
-            self.load_dataset()
-        stat_counts = {
-            'n_text_questions': {
-                'train': 0,
-                'test': 0,
-                'id_to_find': 'nonDiagramQuestions'
-            },
-            'n_diagram_questions': {
-                'train': 0,
-                'test': 0,
-                'id_to_find': 'diagramQuestions'
-            },
-            'n_topics': {
-                'train': 0,
-                'test': 0,
-                'id_to_find': 'topics'
-            },
-            'n_instructional_diagrams': {
-                'train': 0,
-                'test': 0,
-                'id_to_find': 'instructionalDiagrams'
-            },
-        }
+        if self.lesson_index is None:
+            self.build_lesson_index()
         if diagram_only:
-            diagram_only_split = {k: [lid for lid in v if [al for al in self.dataset if al['globalID'] == lid][0]['instructionalDiagrams']]
+            diagram_column = [stat_type for stat_type, id_to_find in self.split_stats].index('n_instructional_diagrams')
+            has_diagrams = self.stat_matrix[:, diagram_column] > 0
+            diagram_only_split = {k: [lid for lid in v if has_diagrams[self.lesson_index[lid]]]
                                   for k, v in test_train_assignments.items()}
             test_train_assignments = diagram_only_split
-        for split in ['test', 'train']:
-            for lesson_id in test_train_assignments[split]:
-                for stat_type, stats in stat_counts.items():
-                    lesson_content = [lesson for lesson in self.dataset if lesson['globalID'] == lesson_id][0]
-                    stats[split] += len(list(self.dict_key_extract(stats['id_to_find'], lesson_content))[0].values())
+        split_totals = {split: self.stat_matrix[self.lesson_rows(test_train_assignments[split])].sum(axis=0)
+                        for split in ['test', 'train']}
+        stat_counts = {}
+        for stat_idx, (stat_type, id_to_find) in enumerate(self.split_stats):
+            stat_counts[stat_type] = {
+                'train': int(split_totals['train'][stat_idx]),
+                'test': int(split_totals['test'][stat_idx]),
+                'id_to_find': id_to_find
+            }
         stat_counts['n_lessons'] = {
             "test": len(test_train_assignments['test']),
             "train": len(test_train_assignments['train']),
@@ -161,7 +287,8 @@ class TestTrainSplitter(DataSetCommonTools):
             stat['test_fraction'] = "{0:.3f}".format(stat['test'] / (stat['train'] + stat['test']))
         return stat_counts
 
-    def split_and_compute_stats(self, manual_assignments={}):
-        tt_split, debug_tt_splits = self.perform_split(manual_assignments=manual_assignments)
+    def split_and_compute_stats(self, manual_assignments={}, n_candidates=0, seed=None):
+        tt_split, debug_tt_splits = self.perform_split(manual_assignments=manual_assignments, n_candidates=n_candidates,
+                                                       seed=seed)
         stats = self.compute_split_stats(tt_split)
         return stats